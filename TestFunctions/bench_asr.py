@@ -0,0 +1,72 @@
+import time
+import glob
+import sys
+import os
+
+# Add parent directory to path to import project modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+import config
+from model_store import ModelStore
+from asr_backends import create_asr
+
+console = Console()
+
+RATE = 16000
+
+def load_audio_set(pattern):
+    """读取固定音频集 (任意采样率，统一转为 16k 单声道 float32)"""
+    import torchaudio
+    clips = []
+    for path in sorted(glob.glob(pattern)):
+        wav, fs = torchaudio.load(path)
+        wav = wav.mean(dim=0)
+        if fs != RATE:
+            wav = torchaudio.functional.resample(wav, fs, RATE)
+        clips.append((os.path.basename(path), wav.numpy().astype(np.float32)))
+    return clips
+
+def bench(asr, clips, rounds=3):
+    """Returns: (RTF, 每句平均延迟)"""
+    total_audio = sum(len(a) for _, a in clips) / RATE * rounds
+    latencies = []
+    for _ in range(rounds):
+        for _, audio in clips:
+            st = time.perf_counter()
+            asr.transcribe(audio)
+            latencies.append(time.perf_counter() - st)
+    return sum(latencies) / total_audio, float(np.mean(latencies))
+
+def main():
+    model_dir = ModelStore().ensure_sensevoice()
+    # 默认使用模型自带的多语种示例音频作为固定测试集
+    pattern = sys.argv[1] if len(sys.argv) > 1 else os.path.join(model_dir, "example", "*")
+    clips = load_audio_set(pattern)
+    if not clips:
+        console.print(f"[red]No audio found for {pattern}[/red]")
+        return
+    console.print(f"{len(clips)} clips, {sum(len(a) for _, a in clips) / RATE:.1f}s of audio")
+
+    table = Table(title=f"SenseVoiceSmall CPU benchmark ({config.STT_CPU_THREADS} threads)")
+    table.add_column("Backend")
+    table.add_column("RTF", justify="right")
+    table.add_column("Latency / utterance", justify="right")
+
+    for backend in ("fp32", "int8", "onnx"):
+        try:
+            asr = create_asr(model_dir, device="cpu", cpu_backend=backend, threads=config.STT_CPU_THREADS)
+        except Exception as e:
+            console.print(f"[yellow]{backend}: {e}[/yellow]")
+            continue
+        rtf, latency = bench(asr, clips)
+        table.add_row(asr.name, f"{rtf:.3f}", f"{latency * 1000:.0f} ms")
+
+    console.print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import time
+import sys
+import os
+
+# Add parent directory to path to import project modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from model_store import ModelStore
+from vad_backends import TorchSileroVAD, OnnxSileroVAD
+
+console = Console()
+
+RATE = 16000
+CHUNK = 512
+
+def load_audio(path, seconds):
+    """读取 wav (单声道 16k)，没有提供文件时用带噪声的合成语音包络代替"""
+    if path:
+        import soundfile as sf
+        data, fs = sf.read(path, dtype="float32")
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+        if fs != RATE:
+            x = np.linspace(0, len(data) - 1, int(len(data) * RATE / fs))
+            data = np.interp(x, np.arange(len(data)), data).astype(np.float32)
+        return data
+    t = np.arange(int(seconds * RATE)) / RATE
+    voiced = (np.sin(2 * np.pi * 0.5 * t) > 0).astype(np.float32)
+    speech = 0.3 * np.sin(2 * np.pi * 220 * t) * voiced
+    return (speech + 0.01 * np.random.randn(len(t))).astype(np.float32)
+
+def bench(vad, audio, batch):
+    n_frames = len(audio) // CHUNK
+    frames = audio[:n_frames * CHUNK].reshape(n_frames, CHUNK)
+    vad.reset()
+    vad.process(frames[:10])  # warm-up
+    vad.reset()
+
+    wall_st, cpu_st = time.perf_counter(), time.process_time()
+    for i in range(0, n_frames, batch):
+        vad.process(frames[i:i + batch])
+    wall, cpu = time.perf_counter() - wall_st, time.process_time() - cpu_st
+    audio_seconds = n_frames * CHUNK / RATE
+    return cpu / audio_seconds, wall / n_frames
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    audio = load_audio(path, seconds=60)
+    store = ModelStore()
+
+    backends = [("torch", lambda: TorchSileroVAD(store.load_silero_vad("cpu"), RATE))]
+    onnx_path = store.silero_vad_file("onnx")
+    if onnx_path:
+        backends.append(("onnx", lambda: OnnxSileroVAD(onnx_path, RATE, CHUNK)))
+    else:
+        console.print("[yellow]silero_vad.onnx not in model store, skipping ONNX backend.[/yellow]")
+
+    table = Table(title=f"Silero VAD benchmark ({len(audio) / RATE:.0f}s of audio)")
+    table.add_column("Backend")
+    table.add_column("Batch")
+    table.add_column("CPU s / audio s", justify="right")
+    table.add_column("Wall ms / frame", justify="right")
+
+    for name, factory in backends:
+        vad = factory()
+        for batch in (1, 4):
+            cpu_ratio, per_frame = bench(vad, audio, batch)
+            table.add_row(name, str(batch), f"{cpu_ratio:.4f}", f"{per_frame * 1000:.3f}")
+
+    console.print(table)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,40 @@
-import requests
 import time
 import json
 import re
 import os
+import queue
 import threading
 # from openai import OpenAI (Removed to fix DLL issue)
 from rich.panel import Panel
 import config
+import http_client
 from tts_engine import TTSEngine
 from face_engine import FaceEngine
 from stt_engine import STTEngine
+from sentence_splitter import SentenceSplitter, strip_emotion_prefix
+from history_manager import HistoryManager
+from ollama_residency import OllamaResidencyManager
+from startup import StartupGraph
+from cancellation import Turn, CancelToken, CancelledError
 
 class EtherealBot:
     """
     Project Ethereal 核心智能体 (Agent Core) - V4.3 音画同步版
     """
-    def __init__(self, ui_callback=None, response_callback=None):
+    def __init__(self, ui_callback=None, response_callback=None, component_callback=None, partial_callback=None):
+        """
+        Args:
+            partial_callback: 说话过程中的增量识别回调 partial_callback(text, perception_data) (在 STT 线程中调用)
+            component_callback: 子系统就绪回调 component_callback(name, result, elapsed, error)，
+                                name 为 face / mouth / ears / brain (在启动线程中调用)
+        """
         self.character_config = self._load_json(config.CHARACTER_CONFIG_PATH)
         self.secrets_config = self._load_json(config.SECRETS_CONFIG_PATH)
         
         # UI Callback for chat display
         self.ui_callback = ui_callback
         self.response_callback = response_callback
+        self.partial_callback = partial_callback
         
         sys_cfg = self.character_config.get("system_settings", {})
         self.brain_type = sys_cfg.get("brain_type", config.DEFAULT_BRAIN)
@@ -29,32 +42,71 @@ class EtherealBot:
         self.ollama_model = sys_cfg.get("ollama_model", config.OLLAMA_MODEL)
         self.temperature = sys_cfg.get("temperature", 0.7)
         self.top_p = sys_cfg.get("top_p", 0.9)
+        # [新增] 流式大脑: 边生成边分句交给 TTS
+        self.stream_mode = sys_cfg.get("stream_mode", True)
 
         self.system_prompt_text = self._construct_system_prompt()
-        self.history = [] 
+        # [修改] 历史记录按 token 预算裁剪，旧的对话在后台并入摘要
+        self.history = HistoryManager(
+            self.system_prompt_text,
+            token_budget=sys_cfg.get("history_token_budget", 4000),
+            summarize_fn=self._summarize_history
+        )
         # self.ds_client = None (Removed)
 
         self._system_check_pre()
         
-        # 初始化脸
-        self.face = FaceEngine()
-        
-        # [关键修改] 绑定 expression_callback 给 TTS
-        self.tts = TTSEngine(
-            self.character_config.get("voice_settings", {}),
-            lip_sync_callback=self.face.set_mouth_open,
-            expression_callback=self.face.set_expression 
+        # [新增] 长连接客户端 (连接池 + 超时 + 重试)
+        self.ollama_http = http_client.get_client("ollama")
+        self.deepseek_http = http_client.get_client("deepseek")
+        # [新增] 本地模型常驻管理 (后台预热 + 空闲保活)
+        self.residency = OllamaResidencyManager(
+            self.ollama_http, self.ollama_model,
+            keep_alive=sys_cfg.get("ollama_keep_alive", config.OLLAMA_KEEP_ALIVE),
+            ping_interval=sys_cfg.get("ollama_keepwarm_interval", config.OLLAMA_KEEPWARM_INTERVAL)
         )
+
+        voice_cfg = self.character_config.get("voice_settings", {})
+        # [新增] 大脑超过该时长 (秒) 还没出第一句，就先播放填充语; <= 0 关闭
+        self.filler_threshold = voice_cfg.get("filler_threshold", 1.5)
+        # 填充语和正式回复可能交叠，静音用引用计数
+        self._mute_lock = threading.Lock()
+        self._mute_count = 0
+        # [新增] 全双工: 说话时耳朵不关，回声消除 + 插话打断
+        self.full_duplex = sys_cfg.get("full_duplex", False)
+        # [修改] 当前这一轮 (持有贯穿 大脑 -> 合成 -> 播放 -> 表情 的取消令牌)
+        self.current_turn = None
+        self._turn_lock = threading.Lock()
+        # [新增] 后台摘要请求的取消令牌: 新的一轮开始时让出模型
+        self._summary_token = None
+        # [Locking] Prevent concurrent processing (Fix duplicate TTS issue)
+        self._processing_lock = threading.Lock()
+
+        # [修改] 各子系统并行启动: 脸 -> 嘴 (依赖脸的回调)，耳朵与大脑各自独立
+        self.startup = StartupGraph(on_component_ready=component_callback)
+        self.startup.add("face", self._init_face)
+        self.startup.add("mouth", lambda: self._init_mouth(voice_cfg), deps=("face",))
+        self.startup.add("ears", self._init_ears)
+        self.startup.add("brain", self._init_brain)
+        self.startup.run()
+        self.startup.wait()
+        config.console.print(f"[dim]{self.startup.report()}[/dim]")
         
-        # [新增] 初始化耳朵 (STT)
-        self.ears = STTEngine(callback=self.on_hearing_input)
-        
-        self._init_brain()
-        
+        if self.full_duplex:
+            self.ears.enable_echo_cancellation(
+                self.tts.output.reference, self.tts.output.busy, on_barge_in=self._on_barge_in
+            )
+
         # Start listening
         self.ears.start_listening()
 
-        self.last_stats = {"brain_time": 0.0, "mouth_time": 0.0}
+        # ttft: 首 token 延迟 / ttfa: 首音延迟 (均从本轮开始计时)
+        # prompt_tokens / prompt_eval_tokens / cached_tokens / prefill_ms: 本轮 prefill 的缓存复用情况
+        # (只记录后端报告的真实值；后端不提供的项为 None)
+        self.last_stats = {
+            "brain_time": 0.0, "mouth_time": 0.0, "ttft": 0.0, "ttfa": 0.0,
+            "prompt_tokens": 0, "prompt_eval_tokens": 0, "cached_tokens": 0, "prefill_ms": None
+        }
         self.current_emotion = "neutral"
 
     def set_audio_input_enabled(self, enabled):
@@ -71,6 +123,11 @@ class EtherealBot:
         event = perception_data.get("event")
         emotion = perception_data.get("emotion", "NEUTRAL").upper()
         
+        # [新增] 增量识别结果: 只更新界面并提前唤醒大脑，不触发对话
+        if perception_data.get("partial"):
+            self._on_partial_input(text, perception_data)
+            return
+
         # 1. Noise Filter: Exit if no text and no special event (or just Speech)
         if not text and (not event or event == "Speech"):
             return
@@ -78,6 +135,13 @@ class EtherealBot:
         # 2. Process in a new thread to prevent blocking the STT loop
         threading.Thread(target=self._process_hearing_thread, args=(text, emotion, event, perception_data)).start()
 
+    def _on_partial_input(self, text, perception_data):
+        """用户还在说话: 本地模型如果已被卸载，趁这段时间重新加载"""
+        if self.brain_type != "deepseek":
+            self.residency.wake()
+        if self.partial_callback:
+            self.partial_callback(text, perception_data)
+
     def _process_hearing_thread(self, text, emotion, event, full_data):
         """
         Threaded processing of hearing input:
@@ -85,13 +149,12 @@ class EtherealBot:
         2. UI Display
         3. Think & Speak (Half-Duplex)
         """
-        # [Locking] Prevent concurrent processing (Fix duplicate TTS issue)
-        if not hasattr(self, '_processing_lock'):
-            self._processing_lock = threading.Lock()
-            
         if not self._processing_lock.acquire(blocking=False):
-            config.console.print("[dim]Ignored concurrent input while processing...[/dim]")
-            return
+            # [修改] 新的一句话直接打断还在进行的回复，马上开始新一轮
+            self._interrupt_turn("new input")
+            if not self._processing_lock.acquire(timeout=3.0):
+                config.console.print("[dim]Previous turn did not stop in time, input dropped.[/dim]")
+                return
 
         try:
             # --- 1. Format Prompt (Chinese Stage Directions) ---
@@ -147,30 +210,35 @@ class EtherealBot:
                 if self.response_callback:
                     self.response_callback(None, "thinking_started")
 
-                response = self.think(prompt_text)
-                
-                if response and response.get("text"):
+                def _on_thought(response):
                     if self.response_callback:
                         self.response_callback(response, "thinking_done")
 
-                    m_time = self.speak(response["text"])
-                    
+                turn = self.begin_turn(prompt_text)
+                response, m_time = self.think_and_speak(prompt_text, on_thought=_on_thought, turn=turn)
+                
+                if response and response.get("text"):
                     if self.response_callback:
                         self.response_callback(response, "speaking_done", m_time)
+                elif turn.cancelled:
+                    # 被停止 / 被新的输入抢占: 不算出错
+                    pass
                 else:
                     if self.response_callback:
                         self.response_callback(None, "error")
                 
             else:
                 # Fallback for CLI mode
-                response = self.think(prompt_text)
-                
-                if response and response.get("text"):
-                    self.speak(response["text"])
+                self.think_and_speak(prompt_text)
                     
         finally:
             self._processing_lock.release()
 
+    @property
+    def is_cold_start(self):
+        """本地模型是否尚未驻留 (下一轮会冷启动)"""
+        return self.brain_type != "deepseek" and self.residency.is_cold
+
     @property
     def voice_enabled(self): return self.tts.enabled
     @voice_enabled.setter
@@ -189,6 +257,10 @@ class EtherealBot:
         except: return {}
 
     def _construct_system_prompt(self):
+        """
+        构造系统提示词 (只在启动时调用一次)
+        输出只取决于 character.json 的内容，保证跨轮次字节一致，KV 缓存前缀可复用
+        """
         cfg = self.character_config
         persona = cfg.get("persona", {})
         kb = cfg.get("knowledge_base", {})
@@ -201,30 +273,95 @@ class EtherealBot:
         prompt += f"\n[INSTRUCTIONS]\n{instr.get('format_rules', '')}\n[EXAMPLES]\n{instr.get('examples', '')}\n"
         return prompt
 
+    def _init_face(self):
+        self.face = FaceEngine()
+        return True
+
+    def _init_mouth(self, voice_cfg):
+        # [关键修改] 绑定 expression_callback 给 TTS
+        self.tts = TTSEngine(
+            voice_cfg,
+            lip_sync_callback=self.face.set_mouth_open,
+            expression_callback=self.face.set_expression 
+        )
+        # [修改] 嘴型由 VTS 注入循环轮询输出引擎的当前包络值，不再从音频回调推送
+        self.face.bind_mouth_source(self.tts.mouth_level)
+        return self.tts.enabled
+
+    def _init_ears(self):
+        # [新增] 初始化耳朵 (STT)
+        self.ears = STTEngine(callback=self.on_hearing_input)
+        return True
+
     def _init_brain(self):
         if self.brain_type == "deepseek":
-            if not self.deepseek_key: config.console.print("[red]❌ DeepSeek Key Missing[/red]")
-            else:
-                # Removed OpenAI client initialization to avoid DLL errors
-                self.history = [{"role": "system", "content": self.system_prompt_text}]
-                self._unload_local_model()
-                config.console.print(f"[green]✔ Brain: DeepSeek V3 (Requests Mode)[/green]")
+            if not self.deepseek_key:
+                config.console.print("[red]❌ DeepSeek Key Missing[/red]")
+                return False
+            # Removed OpenAI client initialization to avoid DLL errors
+            self._unload_local_model()
+            config.console.print(f"[green]✔ Brain: DeepSeek V3 (Requests Mode)[/green]")
         else:
-            self.history.append({"role": "system", "content": self.system_prompt_text})
-            self.is_cold_start = True
-            self._warmup_neural_engine()
-            config.console.print(f"[green]✔ Brain: Local Ollama[/green]")
-
-    def _warmup_neural_engine(self):
-        config.console.print("[dim]预热本地神经网络...[/dim]")
-        try:
-            requests.post(config.OLLAMA_URL, json={"model": self.ollama_model, "messages": [{"role": "user", "content": "hi"}], "stream": False}, timeout=60)
-            self.is_cold_start = False
-        except: pass
+            # [修改] 预热放到后台，不再阻塞启动
+            self.residency.start()
+            config.console.print(f"[green]✔ Brain: Local Ollama (warming up in background)[/green]")
+        return True
 
     def _unload_local_model(self):
-        try: requests.post(config.OLLAMA_URL, json={"model": self.ollama_model, "keep_alive": 0}, timeout=2)
-        except: pass
+        """只在切换大脑或退出时卸载"""
+        self.residency.unload()
+
+    def _summarize_history(self, previous_summary, messages):
+        """
+        [新增] 把移出窗口的旧对话并入滚动摘要 (由 HistoryManager 在后台线程调用)
+        [修改] 新的一轮开始时取消 (begin_turn)，把模型让给用户；
+        本地模型以流式请求，取消即断开连接，服务端随之停止生成。
+        被取消时抛出 CancelledError，这批消息留到下一次折叠再试
+        """
+        token = CancelToken()
+        self._summary_token = token
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = (
+            "请把下面的对话要点压缩成一段简短的摘要 (不超过 200 字)，"
+            "保留人物、事实、约定和用户偏好，只输出摘要本身。\n"
+        )
+        if previous_summary:
+            prompt += f"\n[已有摘要]\n{previous_summary}\n"
+        prompt += f"\n[新增对话]\n{transcript}"
+        request_msgs = [{"role": "user", "content": prompt}]
+
+        if self.brain_type == "deepseek":
+            if not self.deepseek_key: return None
+            resp = self.deepseek_http.post(
+                f"{config.DEEPSEEK_BASE_URL}/chat/completions",
+                endpoint="summarize",
+                headers={"Authorization": f"Bearer {self.deepseek_key}", "Content-Type": "application/json"},
+                json={"model": config.DEEPSEEK_MODEL, "messages": request_msgs, "stream": False, "temperature": 0.3},
+                cancel_token=token
+            )
+            resp.raise_for_status()
+            return resp.json()["choices"][0]["message"]["content"]
+
+        resp = self.ollama_http.post(
+            config.OLLAMA_URL,
+            endpoint="summarize",
+            json={"model": self.ollama_model, "messages": request_msgs, "stream": True,
+                  "keep_alive": self.residency.keep_alive, "options": {"temperature": 0.3}},
+            stream=True,
+            cancel_token=token
+        )
+        self.residency.touch()
+        with resp:
+            resp.raise_for_status()
+            summary = ""
+            try:
+                for line in resp.iter_lines():
+                    if not line: continue
+                    summary += json.loads(line).get("message", {}).get("content", "")
+            except Exception:
+                if not token.cancelled: raise
+            token.raise_if_cancelled()
+        return summary
 
     def _extract_emotion(self, text):
         match = re.match(r'^\[(\w+)\]\s*(.*)', text, re.DOTALL)
@@ -238,76 +375,400 @@ class EtherealBot:
         text = re.sub(r'\*.*?\*', '', text)
         return text.strip()
 
-    def think(self, user_input):
+    def begin_turn(self, user_input=""):
+        """
+        [新增] 开始新的一轮对话，还在进行的上一轮立即被抢占
+        Returns: Turn (把它传给 think_and_speak，事后可查询 turn.cancelled)
+        """
+        turn = Turn(user_input)
+        with self._turn_lock:
+            previous, self.current_turn = self.current_turn, turn
+        if previous is not None:
+            self._cancel(previous, "preempted")
+        # 后台摘要让路: 单并发槽位的本地模型先服务这一轮，也不让摘要挤掉对话的前缀缓存
+        summary_token = self._summary_token
+        if summary_token is not None:
+            summary_token.cancel("turn started")
+        # 取消时立即闭嘴、清空输出 (包括填充语)，表情回到 Neutral
+        turn.token.on_cancel(self.tts.stop_output)
+        turn.token.on_cancel(lambda: self.face.set_expression("neutral"))
+        return turn
+
+    def stop(self, reason="stop"):
+        """[新增] 停止当前这一轮 (GUI 的停止按钮)；Returns: 是否有正在进行的一轮被停止"""
+        return self._interrupt_turn(reason)
+
+    def think_and_speak(self, user_input, on_thought=None, turn=None):
+        """
+        [新增] 完整的一轮对话: 思考 + 说话
+        流式模式下大脑每生成完一句就交给 TTS，首句出来即可开口，
+        不必等整段回复生成完毕。
+
+        Args:
+            user_input: 用户输入
+            on_thought: 大脑生成完毕时的回调 on_thought(response)，用于刷新 UI
+            turn: [新增] 由 begin_turn() 创建的这一轮；None 时新建 (同样会抢占上一轮)
+        Returns:
+            (response, mouth_time)；被取消时 response 为 None
+        """
+        if turn is None:
+            turn = self.begin_turn(user_input)
+        try:
+            return self._run_turn(user_input, on_thought, turn.token)
+        finally:
+            # 这一轮结束后不再是 "当前" 的一轮: 下一轮不会去抢占它，stop() 也不会误报
+            with self._turn_lock:
+                if self.current_turn is turn:
+                    self.current_turn = None
+
+    def _run_turn(self, user_input, on_thought, token):
+        if not self.stream_mode:
+            filler_timer = self._start_filler_timer(token)
+            try:
+                response = self.think(user_input, cancel_token=token)
+            finally:
+                if filler_timer: filler_timer.cancel()
+            if not response or not response.get("text"):
+                return response, 0.0
+            if on_thought:
+                on_thought(response)
+            return response, self.speak(response["text"], cancel_token=token)
+
+        turn_start = time.time()
+        self.last_stats["ttft"] = 0.0
+        self.last_stats["ttfa"] = 0.0
+        sentence_queue = queue.Queue()
+        speaker = None
+        filler_timer = self._start_filler_timer(token)
+
+        def _sentences():
+            while True:
+                sentence = sentence_queue.get()
+                if sentence is None:
+                    return
+                yield sentence
+
+        def _on_audio_start():
+            self.last_stats["ttfa"] = time.time() - turn_start
+
+        def _on_sentence(sentence, emotion):
+            nonlocal speaker
+            if token.cancelled:
+                return
+            if speaker is None:
+                if filler_timer: filler_timer.cancel()
+                # 第一句到达时情感标签已经解析完毕
+                self.current_emotion = emotion
+                speaker = threading.Thread(
+                    target=self._speak_stream_worker,
+                    args=(_sentences(), emotion, _on_audio_start, token),
+                    daemon=True
+                )
+                speaker.start()
+            sentence_queue.put(sentence)
+
+        try:
+            response = self.think(user_input, on_sentence=_on_sentence, cancel_token=token)
+        finally:
+            if filler_timer: filler_timer.cancel()
+            sentence_queue.put(None)
+
+        if response and response.get("text") and on_thought:
+            on_thought(response)
+
+        if speaker is None:
+            # 一句都没说出来，别让表情卡在 Thinking
+            self.face.set_expression("neutral")
+            return response, 0.0
+        if token.cancelled:
+            # 已被取消: 扬声器线程很快会退出，不必再等
+            speaker.join(timeout=1.0)
+            return response, self.last_stats["mouth_time"]
+
+        speaker.join()
+        config.console.print(
+            f"[dim]TTFT: {self.last_stats['ttft']:.2f}s | TTFA: {self.last_stats['ttfa']:.2f}s[/dim]"
+        )
+        return response, self.last_stats["mouth_time"]
+
+    def _speak_stream_worker(self, sentences, emotion, on_audio_start, token):
+        st = time.time()
+        
+        # [Half-Duplex] Disable listening while speaking to avoid echo loop
+        self._mute_ears()
+        try:
+            self.tts.speak_stream(sentences, emotion, on_audio_start=on_audio_start, cancel_token=token)
+        finally:
+            self._unmute_ears()
+
+        self.last_stats["mouth_time"] = time.time() - st
+
+    def _start_filler_timer(self, token):
+        """[新增] 大脑迟迟没有回应时播放填充语"""
+        if self.filler_threshold <= 0 or not self.voice_enabled:
+            return None
+        timer = threading.Timer(self.filler_threshold, self._play_filler, args=(token,))
+        timer.daemon = True
+        timer.start()
+        token.on_cancel(timer.cancel)
+        return timer
+
+    def _play_filler(self, token):
+        self._mute_ears()
+        try:
+            self.tts.play_filler(cancel_token=token)
+        finally:
+            self._unmute_ears()
+
+    def _on_barge_in(self):
+        """[新增] 用户在回复播放期间开口: 立即停下，把话筒让给用户"""
+        self._interrupt_turn("barge-in")
+        if self.response_callback:
+            self.response_callback(None, "interrupted")
+
+    def _interrupt_turn(self, reason):
+        """停止当前这一轮: 大脑请求、合成、播放、嘴型与表情"""
+        turn = self.current_turn
+        return turn is not None and self._cancel(turn, reason)
+
+    def _cancel(self, turn, reason):
+        """取消一轮 (各环节的释放由令牌回调同步完成)"""
+        st = time.time()
+        if not turn.cancel(reason):
+            return False
+        config.console.print(
+            f"[yellow]Turn #{turn.id} cancelled ({reason}) in {(time.time() - st) * 1000:.0f} ms[/yellow]"
+        )
+        return True
+
+    def _mute_ears(self):
+        """[Half-Duplex] 说话期间关闭耳朵"""
+        if not hasattr(self, 'ears') or self.full_duplex: return
+        with self._mute_lock:
+            self._mute_count += 1
+            if self._mute_count == 1:
+                self.ears.set_listening_active(False)
+
+    def _unmute_ears(self):
+        """所有播放都结束后再打开耳朵"""
+        if not hasattr(self, 'ears') or self.full_duplex: return
+        # [修改] 等输出引擎真正播完，而不是固定 sleep 0.5s
+        self.tts.output.wait_drained()
+        with self._mute_lock:
+            self._mute_count -= 1
+            if self._mute_count == 0:
+                self.ears.set_listening_active(True)
+
+    def think(self, user_input, on_sentence=None, cancel_token=None):
+        """
+        Args:
+            on_sentence: [新增] 流式回调 on_sentence(sentence, emotion)。
+                         传入时每凑齐一句就回调一次。
+            cancel_token: [新增] 取消令牌。传入时总是以流式请求大脑，
+                          取消即关闭连接，服务端随之停止生成
+        """
         # [新增] 在开始思考前，立即切换到 Thinking 表情
-        self.face.set_expression("thinking")
+        self.face.set_expression("thinking", cancel_token=cancel_token)
         
         try:
-            if self.brain_type == "deepseek": return self._think_deepseek(user_input)
-            return self._think_ollama(user_input)
+            if self.brain_type == "deepseek": return self._think_deepseek(user_input, on_sentence, cancel_token)
+            return self._think_ollama(user_input, on_sentence, cancel_token)
         except Exception as e:
             # 兜底：如果思考过程崩溃，重置表情
             self.face.set_expression("neutral")
             return None
 
-    def _think_deepseek(self, user_input):
+    def _think_deepseek(self, user_input, on_sentence=None, cancel_token=None):
         if not self.deepseek_key: return None
-        self.history.append({"role": "user", "content": user_input})
+        self.history.append("user", user_input)
         st = time.time()
+        stream = on_sentence is not None or cancel_token is not None
         try:
-            # Use standard requests instead of OpenAI SDK
+            # Use pooled requests session instead of OpenAI SDK
             headers = {
                 "Authorization": f"Bearer {self.deepseek_key}",
                 "Content-Type": "application/json"
             }
             payload = {
                 "model": config.DEEPSEEK_MODEL,
-                "messages": self.history,
-                "stream": False,
+                "messages": self.history.messages(),
+                "stream": stream,
                 "temperature": self.temperature,
                 "top_p": self.top_p
             }
-            resp = requests.post(
+            if stream:
+                # 流式响应默认不带 usage，需显式要求 (用于统计缓存命中)
+                payload["stream_options"] = {"include_usage": True}
+            resp = self.deepseek_http.post(
                 f"{config.DEEPSEEK_BASE_URL}/chat/completions",
+                endpoint="chat",
                 headers=headers,
                 json=payload,
-                timeout=30
+                stream=stream,
+                cancel_token=cancel_token
             )
             
             if resp.status_code == 200:
-                data = resp.json()
-                raw = data["choices"][0]["message"]["content"]
-                return self._process_response(raw, time.time()-st, payload)
+                if stream:
+                    with resp:
+                        raw = self._consume_token_stream(self._iter_deepseek_tokens(resp), st, on_sentence, cancel_token)
+                else:
+                    data = resp.json()
+                    raw = data["choices"][0]["message"]["content"]
+                    self._record_deepseek_usage(data.get("usage"))
+                return self._finish_turn(raw, time.time()-st, payload, cancel_token)
             else:
                 config.console.print(f"[red]DeepSeek API Error: {resp.status_code} - {resp.text}[/red]")
+                resp.close()
                 return None
 
+        except CancelledError:
+            return None
         except Exception as e:
-            config.console.print(f"[red]DeepSeek Error: {e}[/red]")
+            if not (cancel_token and cancel_token.cancelled):
+                config.console.print(f"[red]DeepSeek Error: {e}[/red]")
             return None
 
-    def _think_ollama(self, user_input):
-        self.history.append({"role": "user", "content": user_input})
+    def _think_ollama(self, user_input, on_sentence=None, cancel_token=None):
+        self.history.append("user", user_input)
         st = time.time()
+        stream = on_sentence is not None or cancel_token is not None
         try:
             payload = {
                 "model": self.ollama_model, 
-                "messages": self.history, 
-                "stream": False,
+                "messages": self.history.messages(), 
+                "stream": stream,
+                "keep_alive": self.residency.keep_alive,
                 "options": {
                     "temperature": self.temperature,
                     "top_p": self.top_p
                 }
             }
-            resp = requests.post(config.OLLAMA_URL, json=payload)
+            self.residency.touch()
+            resp = self.ollama_http.post(
+                config.OLLAMA_URL, endpoint="chat", json=payload, stream=stream, cancel_token=cancel_token
+            )
             if resp.status_code == 200:
-                raw = resp.json()["message"]["content"]
-                return self._process_response(raw, time.time()-st, payload)
-        except: pass
+                if stream:
+                    with resp:
+                        raw = self._consume_token_stream(self._iter_ollama_tokens(resp), st, on_sentence, cancel_token)
+                else:
+                    data = resp.json()
+                    raw = data["message"]["content"]
+                    self._record_ollama_prefill(data)
+                return self._finish_turn(raw, time.time()-st, payload, cancel_token)
+            config.console.print(f"[red]Ollama API Error: {resp.status_code}[/red]")
+            resp.close()
+        except CancelledError:
+            return None
+        except Exception as e:
+            if not (cancel_token and cancel_token.cancelled):
+                config.console.print(f"[red]Ollama Error: {e}[/red]")
         return None
 
+    def _finish_turn(self, raw, duration, payload, cancel_token):
+        """大脑回复结束: 被取消时只把已经生成的部分记入历史，不再交给后续环节"""
+        if cancel_token is not None and cancel_token.cancelled:
+            if raw:
+                self.history.append("assistant", raw)
+            return None
+        return self._process_response(raw, duration, payload)
+
+    def _iter_ollama_tokens(self, resp):
+        """解析 Ollama 的 NDJSON 流"""
+        for line in resp.iter_lines():
+            if not line: continue
+            chunk = json.loads(line)
+            content = chunk.get("message", {}).get("content", "")
+            if content: yield content
+            # 不在 done 处 break: 读到流结束连接才会回到连接池
+            if chunk.get("done"): self._record_ollama_prefill(chunk)
+
+    def _iter_deepseek_tokens(self, resp):
+        """解析 DeepSeek (OpenAI 兼容) 的 SSE 流"""
+        for line in resp.iter_lines():
+            if not line: continue
+            line = line.decode("utf-8")
+            if not line.startswith("data:"): continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]": continue  # 读到流结束连接才会回到连接池
+            chunk = json.loads(data)
+            if chunk.get("usage"): self._record_deepseek_usage(chunk["usage"])
+            choices = chunk.get("choices") or [{}]
+            content = choices[0].get("delta", {}).get("content")
+            if content: yield content
+
+    def _record_ollama_prefill(self, data):
+        """
+        [新增] 记录 Ollama 的 prefill 开销
+        prompt_eval_count 只统计本轮实际计算的 prompt token (KV 缓存命中越多越小)，
+        配合 prompt_eval_duration 观察前缀复用效果。
+        Ollama 不报告整段 prompt 的 token 数，所以不推算 "缓存了多少" (字符估算与真实计数混算不可靠)。
+        """
+        evaluated = data.get("prompt_eval_count", 0)
+        prefill_ms = data.get("prompt_eval_duration", 0) / 1e6
+        self.last_stats["prompt_tokens"] = None
+        self.last_stats["prompt_eval_tokens"] = evaluated
+        self.last_stats["cached_tokens"] = None
+        self.last_stats["prefill_ms"] = prefill_ms
+        config.console.print(f"[dim]Prefill: {evaluated} prompt tokens evaluated in {prefill_ms:.0f} ms[/dim]")
+
+    def _record_deepseek_usage(self, usage):
+        """[新增] 记录 DeepSeek 的上下文缓存命中情况"""
+        if not usage: return
+        self.last_stats["prompt_tokens"] = usage.get("prompt_tokens", 0)
+        self.last_stats["prompt_eval_tokens"] = usage.get("prompt_cache_miss_tokens", usage.get("prompt_tokens", 0))
+        self.last_stats["cached_tokens"] = usage.get("prompt_cache_hit_tokens", 0)
+        self.last_stats["prefill_ms"] = None
+        config.console.print(
+            f"[dim]Prefill: {self.last_stats['prompt_eval_tokens']} new / {self.last_stats['prompt_tokens']} prompt tokens "
+            f"({self.last_stats['cached_tokens']} cached)[/dim]"
+        )
+
+    def _consume_token_stream(self, tokens, st, on_sentence=None, cancel_token=None):
+        """
+        消费 token 流: 解析开头的 [emotion] 标签，按句切分后回调 on_sentence
+        (on_sentence 为 None 时只拼接完整回复)
+        Returns: 完整的原始回复 (被取消时为已生成的部分)
+        """
+        splitter = SentenceSplitter()
+        raw = ""
+        emotion = None
+
+        def _emit(sentences):
+            if on_sentence is None: return
+            for sentence in sentences:
+                clean = self._clean_text_for_display(sentence)
+                if clean: on_sentence(clean, emotion)
+
+        try:
+            for token in tokens:
+                if cancel_token is not None and cancel_token.cancelled:
+                    # 被取消: 不再往下读 (连接已由令牌关闭)
+                    break
+                if not raw:
+                    self.last_stats["ttft"] = time.time() - st
+                raw += token
+                if emotion is None:
+                    # 情感标签还没解析出来之前先攒着
+                    emotion, rest = strip_emotion_prefix(raw)
+                    if emotion is None: continue
+                    token = rest
+                _emit(splitter.feed(token))
+        except Exception:
+            # 取消时连接被关闭，读取会抛错: 视为正常结束，保留已生成的部分
+            if cancel_token is None or not cancel_token.cancelled:
+                raise
+
+        if emotion is None:
+            emotion, rest = strip_emotion_prefix(raw)
+            emotion = emotion or "neutral"
+            splitter.feed(rest)
+        _emit(splitter.flush())
+        return raw
+
     def _process_response(self, raw_text, duration, payload=None):
-        self.history.append({"role": "assistant", "content": raw_text})
+        self.history.append("assistant", raw_text)
         self.last_stats["brain_time"] = duration
         
         emotion, temp_text = self._extract_emotion(raw_text)
@@ -319,30 +780,29 @@ class EtherealBot:
         config.console.print(f"\n[cyan]Ethereal ({emotion}):[/cyan] {clean_text}")
         return {"text": clean_text, "emotion": emotion, "duration": duration, "raw": raw_text, "payload": payload or {}}
 
-    def speak(self, text):
+    def speak(self, text, cancel_token=None):
         st = time.time()
         
         # [修改] 移除重复的 Thinking 表情设置 (已移动到 think)
         
         # [Half-Duplex] Disable listening while speaking to avoid echo loop
-        if hasattr(self, 'ears'):
-            self.ears.set_listening_active(False)
-            
+        self._mute_ears()
         try:
             # [修改] 传入当前情感
-            self.tts.speak(text, self.current_emotion)
+            self.tts.speak(text, self.current_emotion, cancel_token=cancel_token)
         finally:
-            # [Half-Duplex] Re-enable listening after speaking
-            # Add a small delay to avoid picking up the tail of the audio
-            if hasattr(self, 'ears'):
-                # Ideally, this should be done after the audio actually finishes playing.
-                # Since tts.speak is blocking (due to sd.sleep), this is safe.
-                # Adding a small buffer time just in case.
-                time.sleep(0.5)
-                self.ears.set_listening_active(True)
+            # [Half-Duplex] Re-enable listening exactly when playback drains
+            self._unmute_ears()
 
         self.last_stats["mouth_time"] = time.time() - st
         return self.last_stats["mouth_time"]
 
+    def detach(self):
+        """[新增] 重新加载核心前停止本实例的后台保活 (模型留给新实例)"""
+        self.residency.stop()
+
     def terminate(self):
-        self._unload_local_model()
\ No newline at end of file
+        self._unload_local_model()
+        self.tts.close()
+        config.console.print(f"[dim]HTTP stats: {http_client.all_stats()}[/dim]")
+        http_client.close_all()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import time
+import numpy as np
+import config
+from startup import timed_import
+
+class FunasrSenseVoice:
+    """
+    SenseVoiceSmall (FunASR / PyTorch) 后端
+    CPU 上可选对 Linear 层做动态 int8 量化。
+    """
+    def __init__(self, model_dir, device="cuda", quantize=False, threads=None):
+        AutoModel = timed_import("funasr").AutoModel
+        kwargs = {"ncpu": threads} if threads else {}
+        # disable_update=True to avoid checking for updates at runtime
+        self.model = AutoModel(
+            model=model_dir,
+            device=device,
+            disable_update=True,
+            log_level="ERROR",
+            **kwargs
+        )
+        self.name = "torch-fp32" if device == "cpu" else f"torch-{device}"
+        if quantize and device == "cpu":
+            torch = timed_import("torch")
+            self.model.model = torch.quantization.quantize_dynamic(
+                self.model.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            self.name = "torch-int8"
+
+    def transcribe(self, audio):
+        """audio: float32 16k 单声道；Returns: SenseVoice 原始文本 (含 <|tag|>)"""
+        res = self.model.generate(
+            input=audio,
+            cache={},
+            language="auto",
+            use_itn=True,
+            batch_size_s=60
+        )
+        if res and isinstance(res, list) and len(res) > 0:
+            return res[0].get("text", "")
+        return ""
+
+
+class OnnxSenseVoice:
+    """
+    SenseVoiceSmall (ONNX Runtime) 后端
+    首次使用时由 funasr_onnx 从本地模型目录导出 (量化) ONNX，导出结果留在模型仓库里复用。
+    """
+    def __init__(self, model_dir, quantize=True, threads=4):
+        SenseVoiceSmall = timed_import("funasr_onnx").SenseVoiceSmall
+        self.model = SenseVoiceSmall(model_dir, batch_size=1, quantize=quantize, intra_op_num_threads=threads)
+        self.name = "onnx-int8" if quantize else "onnx-fp32"
+
+    def transcribe(self, audio):
+        res = self.model(audio, language="auto", textnorm="withitn")
+        return res[0] if res else ""
+
+
+def create_asr(model_dir, device="cuda", cpu_backend="onnx", threads=4, warmup=True):
+    """
+    按设备选择 ASR 后端
+    Args:
+        device: "cuda" 时总是走 PyTorch；"cpu" 时按 cpu_backend 选择
+        cpu_backend: "onnx" (ONNX Runtime int8) / "int8" (PyTorch 动态量化) / "fp32"
+        threads: CPU 推理的 intra-op 线程数
+        warmup: 加载后先跑一次短音频，把首句的初始化开销挪到启动阶段
+    """
+    if device != "cpu":
+        asr = FunasrSenseVoice(model_dir, device)
+    else:
+        torch = timed_import("torch")
+        torch.set_num_threads(threads)
+        try:
+            # 只能在任何并行计算开始前设置一次
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+        asr = None
+        if cpu_backend == "onnx":
+            try:
+                asr = OnnxSenseVoice(model_dir, quantize=True, threads=threads)
+            except Exception as e:
+                config.console.print(f"[yellow]ONNX SenseVoice unavailable ({e}), using PyTorch int8.[/yellow]")
+                cpu_backend = "int8"
+        if asr is None:
+            asr = FunasrSenseVoice(model_dir, "cpu", quantize=(cpu_backend == "int8"), threads=threads)
+
+    if warmup:
+        st = time.time()
+        asr.transcribe(np.zeros(16000, dtype=np.float32))
+        config.console.print(f"[dim]ASR warm-up ({asr.name}) {time.time() - st:.2f}s[/dim]")
+    return asr
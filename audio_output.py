@@ -0,0 +1,396 @@
+import time
+import threading
+from collections import deque
+import numpy as np
+import config
+from startup import timed_import
+
+# sounddevice 在第一次打开输出流时才导入 (见 AudioOutputEngine.start)
+sd = None
+
+def resample(data, src_fs, dst_fs):
+    """线性插值重采样 (单声道)"""
+    if src_fs == dst_fs or len(data) == 0:
+        return data
+    n_out = int(round(len(data) * dst_fs / src_fs))
+    x_out = np.linspace(0, len(data) - 1, n_out)
+    return np.interp(x_out, np.arange(len(data)), data).astype(np.float32)
+
+def to_mono(data):
+    if data.ndim > 1:
+        data = np.mean(data, axis=1)
+    return data.astype(np.float32, copy=False)
+
+def compute_envelope(pcm, fs, frame_ms=32, gate=0.002, gain=4.0, attack_ms=0, release_ms=0):
+    """
+    一次性算出整段音频的嘴型包络 (逐采样点，0~1)
+    分帧 RMS -> 门限 / 增益 -> 可选的起音 / 释放平滑，
+    播放时音频回调只需按播放位置取值。
+    """
+    if len(pcm) == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    hop = max(1, int(fs * frame_ms / 1000))
+    n_frames = -(-len(pcm) // hop)
+    frames = np.zeros(n_frames * hop, dtype=np.float32)
+    frames[:len(pcm)] = pcm
+    rms = np.sqrt(np.mean(frames.reshape(n_frames, hop) ** 2, axis=1))
+    env = np.where(rms < gate, 0.0, np.minimum(1.0, rms * gain)).astype(np.float32)
+
+    if attack_ms > 0 or release_ms > 0:
+        # 单极点平滑: 张嘴用 attack 系数，闭嘴用 release 系数
+        attack = np.exp(-frame_ms / attack_ms) if attack_ms > 0 else 0.0
+        release = np.exp(-frame_ms / release_ms) if release_ms > 0 else 0.0
+        level = 0.0
+        for i in range(n_frames):
+            coef = attack if env[i] > level else release
+            level = coef * level + (1.0 - coef) * env[i]
+            env[i] = level
+
+    return np.repeat(env, hop)[:len(pcm)]
+
+class AudioRingBuffer:
+    """
+    单生产者 / 单消费者环形缓冲区 (float32 单声道)
+    读指针只由音频回调推进，写指针只由生产者推进，因此不需要加锁。
+    with_aux=True 时附带一条与采样点一一对应的辅助通道 (如嘴型包络)。
+    """
+    def __init__(self, capacity, with_aux=False):
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=np.float32)
+        self.aux_buffer = np.zeros(self.capacity, dtype=np.float32) if with_aux else None
+        self.write_pos = 0  # 累计写入帧数
+        self.read_pos = 0   # 累计读出帧数
+        self.closed = False
+        self.aborted = False
+
+    def available(self):
+        """可读帧数"""
+        return self.write_pos - self.read_pos
+
+    def free_space(self):
+        return self.capacity - self.available()
+
+    def write(self, data, aux=None):
+        """
+        写入数据，缓冲区满时等待消费者读走 (生产者线程调用)
+        aux: 与 data 等长的辅助通道数据
+        Returns: 实际写入的帧数 (abort 后可能小于 len(data))
+        """
+        offset = 0
+        while offset < len(data) and not self.aborted:
+            free = self.free_space()
+            if free == 0:
+                time.sleep(0.005)
+                continue
+            n = min(free, len(data) - offset)
+            start = self.write_pos % self.capacity
+            first = min(n, self.capacity - start)
+            self.buffer[start:start + first] = data[offset:offset + first]
+            if n > first:
+                self.buffer[:n - first] = data[offset + first:offset + n]
+            if aux is not None and self.aux_buffer is not None:
+                self.aux_buffer[start:start + first] = aux[offset:offset + first]
+                if n > first:
+                    self.aux_buffer[:n - first] = aux[offset + first:offset + n]
+            offset += n
+            self.write_pos += n
+        return offset
+
+    def read_into(self, out):
+        """
+        读出最多 len(out) 帧到 out (音频回调调用，不分配内存)
+        Returns: 实际读出的帧数
+        """
+        n = min(len(out), self.available())
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if n > first:
+            out[first:n] = self.buffer[:n - first]
+        self.read_pos += n
+        return n
+
+    def aux_at(self, pos):
+        """取累计位置 pos 处的辅助通道值"""
+        return self.aux_buffer[pos % self.capacity]
+
+    def close(self):
+        """生产者声明不会再写入"""
+        self.closed = True
+
+    def abort(self):
+        """放弃剩余数据，唤醒阻塞中的 write"""
+        self.aborted = True
+
+    def drained(self):
+        return self.closed and self.available() == 0
+
+
+class ReferenceTap:
+    """
+    已送往声卡的音频 (含静音) 的环形记录，供回声消除作参考信号
+    由音频回调写入；同时记录每次回调的时间与累计位置，
+    用来把麦克风采集时刻换算成对应的播放位置。
+    """
+    def __init__(self, sample_rate, seconds=2.0):
+        self.sample_rate = sample_rate
+        self.buffer = np.zeros(int(sample_rate * seconds), dtype=np.float32)
+        self.total = 0  # 累计写入采样点数
+        self._last_time = None
+        self._last_pos = 0
+
+    def push(self, block, timestamp):
+        """音频回调调用 (不分配内存)"""
+        cap = len(self.buffer)
+        n = min(len(block), cap)
+        start = self.total % cap
+        first = min(n, cap - start)
+        self.buffer[start:start + first] = block[:first]
+        if n > first:
+            self.buffer[:n - first] = block[first:n]
+        self.total += len(block)
+        self._last_pos = self.total
+        self._last_time = timestamp
+
+    def position_at(self, timestamp):
+        """估算 timestamp (time.monotonic) 时刻已送往声卡的累计位置；尚未播放过时返回 None"""
+        if self._last_time is None:
+            return None
+        return self._last_pos + int((timestamp - self._last_time) * self.sample_rate)
+
+    def read(self, start, n):
+        """读出累计位置 [start, start + n) 的采样 (尚未写入或已被覆盖的部分补 0)"""
+        out = np.zeros(n, dtype=np.float32)
+        cap = len(self.buffer)
+        lo = max(start, self.total - cap)
+        hi = min(start + n, self.total)
+        if hi <= lo:
+            return out
+        idx = np.arange(lo, hi) % cap
+        out[lo - start:hi - start] = self.buffer[idx]
+        return out
+
+
+class PlaybackHandle:
+    """一段已入队音频的播放状态 (以环形缓冲区的累计帧位置标记起止)"""
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.started = threading.Event()
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class AudioOutputEngine:
+    """
+    常驻音频输出引擎
+    整个生命周期只打开一个 OutputStream，各段音频重采样后写入环形缓冲区排队播放，
+    段与段之间没有设备开关开销，播放进度通过 PlaybackHandle 的事件通知。
+    """
+    def __init__(self, sample_rate=32000, blocksize=512, buffer_seconds=30, envelope_cfg=None):
+        """
+        Args:
+            envelope_cfg: compute_envelope 的参数 (frame_ms / gate / gain / attack_ms / release_ms)
+        """
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.envelope_cfg = envelope_cfg or {}
+        self.ring = AudioRingBuffer(sample_rate * buffer_seconds, with_aux=True)
+        # 当前播放位置的嘴型值 (音频回调只发布这个值，由 VTS 注入循环按自己的频率读取)
+        self.level = 0.0
+        self.stream = None
+        self.underruns = 0
+        # 等待播完超时的次数 (设备卡住 / 输出流出错)
+        self.stalls = 0
+        # [新增] 实际播放内容的参考信号 (全双工回声消除用)
+        self.reference = ReferenceTap(sample_rate)
+        # flush() 请求: 音频回调把读指针跳到此位置
+        self._skip_to = None
+
+        # 生产者 append，音频回调 popleft (deque 两端操作线程安全)
+        self._handles = deque()
+        self._open_lock = threading.Lock()
+        # 多个生产者 (填充语 / 正式回复) 之间互斥，音频回调不参与加锁
+        self._write_lock = threading.Lock()
+
+    def start(self):
+        """打开输出流 (幂等)"""
+        global sd
+        if self.stream is not None:
+            return True
+        with self._open_lock:
+            if self.stream is not None:
+                return True
+            try:
+                if sd is None:
+                    sd = timed_import("sounddevice")
+                stream = sd.OutputStream(
+                    samplerate=self.sample_rate, channels=1, dtype="float32",
+                    blocksize=self.blocksize, latency="low", callback=self._callback
+                )
+                stream.start()
+                self.stream = stream
+                config.console.print(f"[dim]Audio output online ({self.sample_rate} Hz)[/dim]")
+            except Exception as e:
+                config.console.print(f"[red]Playback Error:[/red] {e}")
+                return False
+        return True
+
+    def enqueue(self, data, fs, cancel_token=None):
+        """
+        排队播放一段音频 (任意采样率 / 声道数)
+        缓冲区满时阻塞到有空间为止。
+        Args:
+            cancel_token: [新增] 所属这一轮的取消令牌，已取消时直接丢弃
+                          (取消回调会 flush，正在阻塞的写入也会随之返回)
+        Returns: PlaybackHandle
+        """
+        if cancel_token is not None and cancel_token.cancelled:
+            pcm = np.zeros(0, dtype=np.float32)
+        else:
+            pcm = resample(to_mono(data), fs, self.sample_rate)
+        if len(pcm) == 0 or not self.start():
+            handle = PlaybackHandle(0, 0)
+            handle.started.set()
+            handle.done.set()
+            return handle
+
+        # 包络在生产者线程里算好，实时线程只查表
+        envelope = compute_envelope(pcm, self.sample_rate, **self.envelope_cfg)
+
+        with self._write_lock:
+            start = self.ring.write_pos
+            handle = PlaybackHandle(start, start + len(pcm))
+            self._handles.append(handle)
+            written = self.ring.write(pcm, envelope)
+            if written < len(pcm):
+                # 被 flush 打断，只写入了一部分
+                handle.end = start + written
+        if cancel_token is not None and cancel_token.cancelled:
+            # 写入期间被取消: 取消回调里的 flush 可能早于这次写入
+            self.flush()
+        return handle
+
+    def flush(self, timeout=0.2):
+        """
+        [新增] 立即丢弃所有未播放的音频 (打断 / 插话)
+        阻塞中的写入会被唤醒并放弃剩余数据；读指针由音频回调跳到写指针处，
+        所有等待中的 PlaybackHandle 随之完成，嘴型归零。
+        """
+        if self.stream is None:
+            return
+        self.ring.abort()
+        with self._write_lock:
+            self._skip_to = self.ring.write_pos
+            self.ring.aborted = False
+        deadline = time.time() + timeout
+        while self._skip_to is not None and time.time() < deadline:
+            time.sleep(0.002)
+
+    def busy(self):
+        """是否还有未播完的音频"""
+        return bool(self._handles)
+
+    def wait(self, handle, margin=2.0):
+        """
+        等待一段音频播完
+        设备卡住或输出流出错时不会无限阻塞: 播放进度 (读指针) 连续 margin 秒没有推进
+        才算卡住，此时记录、清空缓冲区并返回 False
+        """
+        if self._wait_progress(handle, margin):
+            return True
+        self._on_stall(f"playback made no progress for {margin:.1f}s")
+        return False
+
+    def wait_drained(self, margin=2.0):
+        """
+        等待调用时已排队的音频全部播完
+        之后才排进来的音频 (如填充语期间开始的正式回复) 不在等待范围内；
+        卡住的判定同 wait()
+        """
+        try:
+            handle = self._handles[-1]
+        except IndexError:
+            return True
+        return self.wait(handle, margin)
+
+    def _wait_progress(self, handle, margin):
+        """等 handle 完成；读指针每推进一次就重新计时，连续 margin 秒不动返回 False"""
+        last_pos = self.ring.read_pos
+        deadline = time.time() + margin
+        while not handle.wait(0.05):
+            pos = self.ring.read_pos
+            if pos != last_pos:
+                last_pos = pos
+                deadline = time.time() + margin
+            elif time.time() >= deadline:
+                return False
+        return True
+
+    def _on_stall(self, message):
+        """输出卡住: 丢弃排队的音频并唤醒所有等待者，让调用方继续"""
+        self.stalls += 1
+        config.console.print(f"[yellow]AudioOutput: {message}, flushing.[/yellow]")
+        self.flush()
+        # 回调没在运行时 flush 不会推进进度，这里直接结束剩下的各段
+        self._release_handles()
+
+    def _release_handles(self):
+        while self._handles:
+            try:
+                handle = self._handles.popleft()
+            except IndexError:
+                break
+            handle.started.set()
+            handle.done.set()
+
+    def close(self):
+        if self.stream is not None:
+            try:
+                self.stream.stop()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
+        # 唤醒所有等待者
+        self._release_handles()
+
+    def _callback(self, outdata, frames, time_info, status):
+        skip_to = self._skip_to
+        if skip_to is not None:
+            # 读指针只由回调推进，flush 在这里生效
+            self.ring.read_pos = max(self.ring.read_pos, skip_to)
+            self._skip_to = None
+
+        filled = self.ring.read_into(outdata[:, 0])
+        outdata[filled:] = 0
+        self.reference.push(outdata[:, 0], time.monotonic())
+
+        # 推进播放进度，通知各段的开始 / 结束
+        read_pos = self.ring.read_pos
+        handles = self._handles
+        while handles:
+            try:
+                handle = handles[0]
+            except IndexError:
+                # 卡住超时后其他线程刚清空了队列
+                break
+            if read_pos > handle.start:
+                handle.started.set()
+            if read_pos < handle.end:
+                if filled < frames:
+                    # 本段还没写完数据就被读空了
+                    self.underruns += 1
+                break
+            handle.done.set()
+            if handles and handles[0] is handle:
+                handles.popleft()
+
+        # 发布本块中点处的预计算包络值 (实时线程里只写一个 float，不调用任何回调)
+        if filled > 0:
+            self.level = float(self.ring.aux_at(read_pos - filled // 2 - 1))
+        else:
+            self.level = 0.0
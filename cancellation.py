@@ -0,0 +1,85 @@
+import time
+import itertools
+import threading
+import config
+
+class CancelledError(Exception):
+    """当前这一轮已被取消 (停止按钮 / 新的输入 / 插话)"""
+
+
+class CancelToken:
+    """
+    跨线程的取消令牌
+    各环节 (大脑请求、合成、播放、表情) 在阻塞前后检查 cancelled，
+    或用 on_cancel() 注册一个立即释放资源的回调 (关闭连接、清空输出缓冲区)。
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        """
+        取消，并在当前线程依次执行已注册的回调 (只生效一次)
+        Returns: 是否是本次调用取消的
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                # 回调之间互不影响
+                config.console.print(f"[dim]Cancel callback failed: {e}[/dim]")
+        return True
+
+    def on_cancel(self, fn):
+        """
+        注册取消回调；已经取消时立即执行
+        Returns: 注销函数 (资源正常释放后调用，避免重复关闭)
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                def _unregister():
+                    with self._lock:
+                        if fn in self._callbacks:
+                            self._callbacks.remove(fn)
+                return _unregister
+        fn()
+        return lambda: None
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CancelledError(self.reason)
+
+    def wait(self, timeout=None):
+        """阻塞直到取消或超时；Returns: 是否已取消"""
+        return self._event.wait(timeout)
+
+
+_turn_ids = itertools.count(1)
+
+class Turn:
+    """一轮对话 (思考 + 说话)，持有贯穿整轮的取消令牌"""
+    def __init__(self, user_input=""):
+        self.id = next(_turn_ids)
+        self.user_input = user_input
+        self.token = CancelToken()
+        self.started_at = time.time()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def cancel(self, reason="cancelled"):
+        return self.token.cancel(reason)
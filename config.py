@@ -25,6 +25,9 @@ DEFAULT_BRAIN = "ollama"
 # 1. Ollama (Local)
 OLLAMA_URL = "http://127.0.0.1:11434/api/chat"
 OLLAMA_MODEL = "qwen3-vl:8b"
+# [新增] 模型常驻: 每次请求携带的 keep_alive，以及空闲时 keep-warm 的间隔 (秒)
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_KEEPWARM_INTERVAL = 240
 
 # 2. DeepSeek (Cloud)
 DEEPSEEK_BASE_URL = "https://api.deepseek.com"
@@ -35,6 +38,27 @@ TTS_API_URL = "http://127.0.0.1:9880/tts"
 GPT_SOVITS_DIR = r"F:\00_Software\GPT-SoVITS-1007-cu128" 
 TTS_LAUNCH_SCRIPT = "go-api.bat"
 
+# [新增] 各后端 HTTP 超时: { endpoint: (连接超时, 读取超时) }
+HTTP_TIMEOUTS = {
+    "ollama": {
+        "default": (3.05, 120),
+        "chat": (3.05, 120),
+        "warmup": (3.05, 60),
+        "unload": (1.0, 2.0),
+        "summarize": (3.05, 120),
+    },
+    "deepseek": {
+        "default": (5.0, 30),
+        "chat": (5.0, 30),
+        "summarize": (5.0, 60),
+    },
+    "tts": {
+        "default": (3.05, 30),
+        "health": (0.5, 1.0),
+        "synthesize": (3.05, 30),
+    },
+}
+
 # 4. 文件路径
 ASSETS_DIR = os.path.join(BASE_DIR, "assets")
 if not os.path.exists(ASSETS_DIR):
@@ -43,6 +67,44 @@ if not os.path.exists(ASSETS_DIR):
 REF_AUDIO_PATH = os.path.join(ASSETS_DIR, "ref.wav")
 CHARACTER_CONFIG_PATH = os.path.join(BASE_DIR, "character.json")
 
+# [新增] TTS 音频缓存目录
+TTS_CACHE_DIR = os.path.join(BASE_DIR, "cache", "tts")
+
+# [新增] 本地模型仓库 (STT 离线加载，版本固定)
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+SILERO_VAD_VERSION = "v5.1.2"         # snakers4/silero-vad 的 git tag
+SENSEVOICE_MODEL_ID = "iic/SenseVoiceSmall"
+SENSEVOICE_REVISION = "v2.0.4"        # ModelScope 模型版本
+# True: 仓库里缺模型时直接报错，不访问网络；False: 缺模型时按固定版本下载一次存入仓库
+MODEL_OFFLINE = False
+
+# [新增] STT 的 VAD 推理后端: "onnx" (ONNX Runtime) / "torch" (TorchScript)
+STT_VAD_BACKEND = "onnx"
+STT_VAD_THREADS = 1
+# 每次从麦克风读取并批量送入 VAD 的帧数 (每帧 512 采样点 = 32ms)，>1 时减少唤醒次数但增加延迟
+STT_VAD_BATCH_FRAMES = 1
+# [新增] 能量 / 过零率闸门: 静音帧不进神经 VAD
+STT_ENERGY_GATE = True
+# 语音起点前保留的音频 (毫秒)，避免起始音被截掉
+STT_PREROLL_MS = 200
+# [新增] 采集 -> 分段 -> 识别 三级流水线的队列容量
+STT_AUDIO_QUEUE_SIZE = 200   # 采集块数 (每块 32ms * STT_VAD_BATCH_FRAMES)，约 6 秒
+STT_ASR_QUEUE_SIZE = 4       # 待识别的整句数，满时丢弃最旧的一句
+# [新增] 无 GPU 时 SenseVoiceSmall 的推理方式: "onnx" (ONNX Runtime int8) / "int8" (PyTorch 动态量化) / "fp32"
+STT_CPU_BACKEND = "onnx"
+STT_CPU_THREADS = 4
+# [新增] 增量识别: 说话过程中每隔多少毫秒重新识别一次正在增长的句子 (0 关闭)
+STT_PARTIAL_INTERVAL_MS = 400
+STT_PARTIAL_MIN_MS = 500       # 有声部分短于此时不做增量识别
+# [新增] 自适应断句: 句尾静音等待时长的范围 (秒)，基准值为 STTEngine.silence_duration_threshold
+STT_ENDPOINT_MIN_SILENCE = 0.3
+STT_ENDPOINT_MAX_SILENCE = 1.5
+# [新增] 全双工插话检测: 播放期间 (回声消除后) VAD 概率持续高于阈值这么久即打断回复
+STT_BARGE_IN_MS = 128
+STT_BARGE_IN_THRESHOLD = 0.7
+# [新增] 单句最长时长 (秒)，超过即强制切段；语音缓冲区按此预分配
+STT_MAX_UTTERANCE_S = 30
+
 # [新增] 敏感信息配置文件 (用于存储 API Key)
 SECRETS_CONFIG_PATH = os.path.join(BASE_DIR, "secrets.json")
 
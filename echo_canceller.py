@@ -0,0 +1,74 @@
+import numpy as np
+
+class EchoCanceller:
+    """
+    分块频域自适应滤波回声消除 (PBFDAF, overlap-save)
+    以扬声器实际播放的音频为参考信号，估计并减去麦克风里的回声。
+    滤波器长度 = block * partitions (默认 512 * 8 = 256ms @16k)，
+    足以覆盖声卡延迟的估计误差与房间回声尾音。
+    近端有人说话 (双讲) 时降低步长，避免滤波器被人声带偏。
+    """
+    def __init__(self, block=512, partitions=8, mu=0.1, power_smoothing=0.9, ref_floor=1e-4):
+        """
+        Args:
+            block: 每次处理的采样点数 (与 VAD 帧长一致)
+            partitions: 分块数
+            mu: 自适应步长 (0~1)
+            power_smoothing: 各频点参考信号功率的平滑系数
+            ref_floor: 参考信号 RMS 低于此值时不更新滤波器 (没有在播放)
+        """
+        self.block = block
+        self.partitions = partitions
+        self.mu = mu
+        self.power_smoothing = power_smoothing
+        self.ref_floor = ref_floor
+
+        n_bins = block + 1
+        self.weights = np.zeros((partitions, n_bins), dtype=np.complex128)
+        self.ref_spectra = np.zeros((partitions, n_bins), dtype=np.complex128)
+        self.power = np.full(n_bins, 1e-6)
+        self._prev_ref = np.zeros(block, dtype=np.float64)
+        self._ref_window = np.zeros(2 * block, dtype=np.float64)
+        self._err_window = np.zeros(2 * block, dtype=np.float64)
+
+    def reset(self):
+        self.weights[:] = 0
+        self.ref_spectra[:] = 0
+        self.power[:] = 1e-6
+        self._prev_ref[:] = 0
+
+    def process(self, mic, ref):
+        """
+        Args:
+            mic: 麦克风一帧 (block,) float32
+            ref: 对齐到同一时段的参考信号 (block,) float32
+        Returns: 消除回声后的一帧 (block,) float32
+        """
+        N = self.block
+        # 参考信号频谱历史: [上一帧 | 当前帧]
+        self._ref_window[:N] = self._prev_ref
+        self._ref_window[N:] = ref
+        self._prev_ref[:] = ref
+        self.ref_spectra = np.roll(self.ref_spectra, 1, axis=0)
+        self.ref_spectra[0] = np.fft.rfft(self._ref_window)
+
+        echo = np.fft.irfft(np.sum(self.weights * self.ref_spectra, axis=0))[N:]
+        err = mic - echo
+
+        ref_rms = np.sqrt(np.mean(ref * ref))
+        if ref_rms > self.ref_floor:
+            mic_energy = float(np.dot(mic, mic))
+            echo_energy = float(np.dot(echo, echo))
+            # 麦克风能量远大于回声估计: 很可能近端有人说话，放慢更新
+            mu = self.mu * (0.1 if mic_energy > 4.0 * echo_energy and echo_energy > 0 else 1.0)
+
+            self.power = self.power_smoothing * self.power + (1 - self.power_smoothing) * np.abs(self.ref_spectra[0]) ** 2
+            self._err_window[N:] = err
+            err_spectrum = np.fft.rfft(self._err_window)
+            gradient = np.conj(self.ref_spectra) * err_spectrum * (mu / (self.power + 1e-10))
+            # 梯度约束: 去掉循环卷积的部分
+            g = np.fft.irfft(gradient, axis=1)
+            g[:, N:] = 0
+            self.weights += np.fft.rfft(g, axis=1)
+
+        return err.astype(np.float32)
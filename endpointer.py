@@ -0,0 +1,109 @@
+import re
+from collections import deque
+import numpy as np
+
+# 句末标点 / 语气词: 句子大概率已经说完
+_FINAL_RE = re.compile(r'([。！？!?…]|\.(?!\d)|吧|吗|呢|啦|了)\s*$')
+# 逗号 / 连接词 / 犹豫词: 还有后半句
+_CONTINUE_RE = re.compile(
+    r'([，,、：:；;]|然后|就是|那个|还有|但是|因为|所以|而且|如果|嗯|呃|\b(and|but|so|because|um|uh|the|to|of))\s*$',
+    re.IGNORECASE
+)
+
+class Endpointer:
+    """
+    自适应断句 (说完一句话后要等多久再交给识别)
+    在固定静音时长的基础上按以下信号缩短或延长:
+    - 增量识别的文本: 以句末标点 / 语气词结尾则缩短，以逗号 / 连接词结尾则延长
+    - 静音期间 VAD 概率的走势: 干净地落到接近 0 则缩短，在阈值附近徘徊 (气声、拖音) 则延长
+    - 句子长度: 很短的应答 ("好的") 缩短，长段独白略微延长
+    每次断句记录原因与实际等待时长，stats() 给出 p50 / p95。
+    """
+    def __init__(self, base_silence=0.8, min_silence=0.3, max_silence=1.5, frame_seconds=0.032, history=200):
+        """
+        Args:
+            base_silence: 没有额外信号时的静音时长 (秒)，即原来的固定阈值
+            min_silence / max_silence: 调整后的上下限
+            frame_seconds: 每帧时长，用于统计静音期间的 VAD 走势
+        """
+        self.base_silence = base_silence
+        self.min_silence = min_silence
+        self.max_silence = max_silence
+        self.frame_seconds = frame_seconds
+        # 静音期间的 VAD 概率 (约 0.3 秒)
+        self._probs = deque(maxlen=max(3, int(0.3 / frame_seconds)))
+        self._waits = deque(maxlen=history)
+        self.decisions = {}
+
+    def reset(self):
+        """新的一句话开始"""
+        self._probs.clear()
+
+    def observe(self, prob, silent):
+        """
+        每帧调用
+        Args:
+            silent: 当前帧是否被判为静音 (说话帧会清空静音走势)
+        """
+        if silent:
+            self._probs.append(float(prob))
+        else:
+            self._probs.clear()
+
+    def required_silence(self, utterance_seconds, partial_text=None):
+        """
+        Returns: (所需静音时长, 原因)
+        partial_text: 覆盖到最后一个有声帧的增量识别文本，没有则为 None
+        """
+        wait = self.base_silence
+        reasons = []
+
+        if partial_text:
+            if _CONTINUE_RE.search(partial_text):
+                wait += 0.5
+                reasons.append("continuation")
+            elif _FINAL_RE.search(partial_text):
+                wait -= 0.4
+                reasons.append("sentence-final")
+
+        if len(self._probs) == self._probs.maxlen:
+            probs = np.asarray(self._probs)
+            if probs.max() < 0.05:
+                wait -= 0.2
+                reasons.append("clean-silence")
+            elif probs.mean() > 0.2:
+                wait += 0.3
+                reasons.append("hovering-vad")
+
+        if utterance_seconds < 0.8:
+            wait -= 0.2
+            reasons.append("short")
+        elif utterance_seconds > 6.0:
+            wait += 0.2
+            reasons.append("long")
+
+        wait = min(self.max_silence, max(self.min_silence, wait))
+        return wait, "+".join(reasons) or "base"
+
+    def decide(self, silence_seconds, utterance_seconds, partial_text=None):
+        """
+        Returns: (是否断句, 原因, 所需静音时长)
+        """
+        required, reason = self.required_silence(utterance_seconds, partial_text)
+        if silence_seconds < required:
+            return False, reason, required
+        self._waits.append(silence_seconds)
+        self.decisions[reason] = self.decisions.get(reason, 0) + 1
+        return True, reason, required
+
+    def stats(self):
+        """断句等待时长统计 (毫秒)"""
+        if not self._waits:
+            return {"endpoints": 0}
+        waits = np.asarray(self._waits) * 1000
+        return {
+            "endpoints": len(waits),
+            "wait_p50_ms": int(np.percentile(waits, 50)),
+            "wait_p95_ms": int(np.percentile(waits, 95)),
+            "decisions": dict(self.decisions)
+        }
@@ -25,19 +25,23 @@ class FaceEngine:
         # 表情切换的淡入淡出时间 (秒), 范围 0-2
         self.fade_time = 0.5
 
-    def set_expression(self, emotion, fade_time=None):
+    def set_expression(self, emotion, fade_time=None, cancel_token=None):
         """
         根据情感标签切换 VTS 表情 (互斥切换 - 自动关闭旧表情)
 
         Args:
             emotion: 情感标签 (如 "[Happy]", "sad" 等)
             fade_time: 表情切换的淡入淡出时间 (秒)，None 则使用默认值
+            cancel_token: [新增] 所属这一轮的取消令牌
         """
         if not self.adapter.connected:
             return
 
         # 1. 清洗情感标签
         clean_emo = emotion.replace("[", "").replace("]", "").lower()
+        # 已取消的轮次不再切换表情 (恢复 Neutral 除外)
+        if cancel_token is not None and cancel_token.cancelled and clean_emo != "neutral":
+            return
 
         # 2. 查找映射的目标名称
         # 如果 map 中没有定义，就直接尝试用 clean_emo 去查找 (比如 "surprised")
@@ -48,7 +52,11 @@ class FaceEngine:
             fade_time = self.fade_time
 
         config.console.print(f"[Face] Requesting expression: {clean_emo} -> VTS Name: {target_name}")
-        self.adapter.set_expression_by_name(target_name, fade_time)
+        self.adapter.set_expression_by_name(target_name, fade_time, cancel_token)
+
+    def bind_mouth_source(self, source):
+        """[新增] 嘴型数据源 source() -> float，由 VTS 注入循环以固定频率轮询"""
+        self.adapter.mouth_source = source
 
     def set_mouth_open(self, value):
         if self.adapter.connected:
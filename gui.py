@@ -5,7 +5,7 @@ import json
 import os
 from PIL import Image
 import config
-from agent import EtherealBot
+import startup
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("dark-blue")
@@ -47,6 +47,8 @@ class EtherealApp(ctk.CTk):
         self.show_chat_view()
 
         # 启动异步加载
+        # [新增] 主循环开始后的第一次空闲即首帧绘制完成
+        self.after(0, lambda: startup.mark("first paint"))
         self.after(100, self.start_async_loading)
 
     def _build_sidebar(self):
@@ -67,7 +69,9 @@ class EtherealApp(ctk.CTk):
         self.mouth_status = ctk.CTkLabel(self.status_card, text="● Mouth: Init...", text_color="gray", font=("Consolas", 12), anchor="w")
         self.mouth_status.pack(fill="x", padx=15, pady=(0, 5))
         self.ears_status = ctk.CTkLabel(self.status_card, text="● Ears: Init...", text_color="gray", font=("Consolas", 12), anchor="w")
-        self.ears_status.pack(fill="x", padx=15, pady=(0, 10))
+        self.ears_status.pack(fill="x", padx=15, pady=(0, 5))
+        self.face_status = ctk.CTkLabel(self.status_card, text="● Face: Init...", text_color="gray", font=("Consolas", 12), anchor="w")
+        self.face_status.pack(fill="x", padx=15, pady=(0, 10))
 
         # 3. 实时元数据 (Live Metadata) - 常驻显示
         self.meta_frame = ctk.CTkFrame(self.sidebar, fg_color="transparent")
@@ -156,6 +160,11 @@ class EtherealApp(ctk.CTk):
         self.send_btn.grid(row=0, column=1)
         self.send_btn.configure(state="disabled")
 
+        # [新增] 停止当前这一轮 (思考 / 说话 / 表情一并停下)
+        self.stop_btn = ctk.CTkButton(self.input_frame, text="STOP", width=80, height=50, fg_color="#7f1d1d", hover_color="#991b1b", command=self.stop_turn_event)
+        self.stop_btn.grid(row=0, column=2, padx=(10, 0))
+        self.stop_btn.configure(state="disabled")
+
         # Right: Debug Panel (Permanent)
         self.debug_frame = ctk.CTkFrame(self.view_chat, fg_color="#18181b", corner_radius=10)
         self.debug_frame.grid(row=0, column=1, sticky="nsew")
@@ -372,7 +381,9 @@ class EtherealApp(ctk.CTk):
             with open(config.SECRETS_CONFIG_PATH, 'w', encoding='utf-8') as f: json.dump(secrets, f, indent=4, ensure_ascii=False)
             
             if self.bot:
-                self.bot = EtherealBot()
+                from agent import EtherealBot
+                self.bot.detach()
+                self.bot = EtherealBot(component_callback=self.handle_component_ready)
                 bn = self.bot.brain_type.title()
                 self.brain_status.configure(text=f"● Brain: {bn}", text_color="#4ade80")
                 self.append_log(f"[System] Reloaded. Engine: {bn}")
@@ -387,21 +398,44 @@ class EtherealApp(ctk.CTk):
     # --- Core Logic ---
     def start_async_loading(self): threading.Thread(target=self._load_bot_core, daemon=True).start()
     def _load_bot_core(self):
+        # [修改] agent 及其依赖的 torch / funasr / pyaudio / pyvts 在此后台线程里导入
+        from agent import EtherealBot
+        startup.mark("agent imported")
         # Initialize Bot with UI Callback
-        self.bot = EtherealBot(ui_callback=self.handle_audio_input, response_callback=self.handle_ai_response)
+        self.bot = EtherealBot(ui_callback=self.handle_audio_input, response_callback=self.handle_ai_response,
+                               component_callback=self.handle_component_ready,
+                               partial_callback=self.handle_partial_transcript)
         
+        startup.mark("bot ready")
+        config.console.print(f"[dim]{startup.profile_report()}[/dim]")
         self.is_ready = True
         self.after(0, self.load_settings_to_ui)
-        bn = self.bot.brain_type.title()
-        self.brain_status.configure(text=f"● Brain: {bn}", text_color="#4ade80")
+        self.after(0, self.update_brain_status)
         self.update_mouth_status()
         self.update_ears_status() # New
         self.activity_label.configure(text="[IDLE]", text_color="#60a5fa")
         self.emotion_label.configure(text="[NEUTRAL]")
         self.entry.configure(state="normal", placeholder_text="Send a message...")
         self.send_btn.configure(state="normal")
+        self.stop_btn.configure(state="normal")
         self.add_message("Ethereal", "Link Established.", False)
 
+    def handle_component_ready(self, name, result, elapsed, error):
+        """[新增] 子系统启动完成即点亮对应状态灯 (在启动线程中调用，转回主线程)"""
+        self.after(0, lambda: self._show_component_ready(name, result, elapsed, error))
+
+    def _show_component_ready(self, name, result, elapsed, error):
+        label = {"brain": self.brain_status, "mouth": self.mouth_status,
+                 "ears": self.ears_status, "face": self.face_status}.get(name)
+        if label is None: return
+        title = name.title()
+        if error is not None:
+            label.configure(text=f"○ {title}: Failed", text_color="#f87171")
+        elif result:
+            label.configure(text=f"● {title}: Ready ({elapsed:.1f}s)", text_color="#4ade80")
+        else:
+            label.configure(text=f"○ {title}: Offline", text_color="#facc15")
+
     def toggle_audio_input(self):
         """Toggle STT listening state."""
         if not self.bot: return
@@ -409,6 +443,16 @@ class EtherealApp(ctk.CTk):
         self.bot.set_audio_input_enabled(is_on)
         self.update_ears_status()
 
+    def update_brain_status(self):
+        """[新增] 刷新大脑状态 (本地模型预热 / 被卸载时显示 Cold)，每秒轮询一次"""
+        if self.bot:
+            bn = self.bot.brain_type.title()
+            if self.bot.is_cold_start:
+                self.brain_status.configure(text=f"● Brain: {bn} (Cold)", text_color="#facc15")
+            else:
+                self.brain_status.configure(text=f"● Brain: {bn}", text_color="#4ade80")
+        self.after(1000, self.update_brain_status)
+
     def update_mouth_status(self):
         if self.bot and self.bot.voice_enabled: self.mouth_status.configure(text="● Mouth: Online", text_color="#4ade80")
         else: self.mouth_status.configure(text="○ Mouth: Offline", text_color="#facc15")
@@ -449,10 +493,14 @@ class EtherealApp(ctk.CTk):
         if prompt_text:
             threading.Thread(target=self.process_ai_response, args=(prompt_text,), daemon=True).start()
 
+    def handle_partial_transcript(self, text, full_data):
+        """[新增] 说话过程中的增量识别结果，在 STT 面板末尾实时刷新"""
+        self.after(0, self.show_stt_partial, text)
+
     def handle_ai_response(self, data, stage="thinking_done", m_time=0):
         """
         Callback to handle updates from Agent's thread.
-        stages: thinking_started, thinking_done, speaking_done, error
+        stages: thinking_started, thinking_done, speaking_done, interrupted, error
         """
         if stage == "thinking_started":
             self.after(0, lambda: self.activity_label.configure(text="[THINKING]", text_color="#c084fc"))
@@ -470,6 +518,9 @@ class EtherealApp(ctk.CTk):
                 self.after(0, self.update_debug_panels, data.get("payload"), data["duration"], m_time)
             self.after(0, lambda: self.activity_label.configure(text="[IDLE]", text_color="#60a5fa"))
             
+        elif stage == "interrupted":
+            self.after(0, lambda: self.activity_label.configure(text="[LISTENING]", text_color="#facc15"))
+            
         elif stage == "error":
             self.after(0, self.add_message, "System", "Link Lost (Agent Error).", False)
             self.after(0, lambda: self.activity_label.configure(text="[IDLE]", text_color="#60a5fa"))
@@ -503,13 +554,19 @@ class EtherealApp(ctk.CTk):
         if not text: return
         self.entry.delete(0, "end")
         self.add_message("You", text, is_user=True)
-        self.entry.configure(state="disabled")
         threading.Thread(target=self.process_ai_response, args=(text,), daemon=True).start()
 
+    def stop_turn_event(self):
+        """[新增] 停止按钮: 在后台线程里取消，避免阻塞界面"""
+        if not self.is_ready or not self.bot: return
+        threading.Thread(target=self.bot.stop, daemon=True).start()
+
     def process_ai_response(self, user_text):
         self.after(0, lambda: self.activity_label.configure(text="[THINKING]", text_color="#c084fc"))
-        data = self.bot.think(user_text)
-        if data:
+        # [修改] 新的输入会抢占还在进行的上一轮，输入框不再锁定
+        turn = self.bot.begin_turn(user_text)
+
+        def _on_thought(data):
             self.after(0, self.add_message, "Ethereal", data["text"], False)
             self.after(0, self.update_emotion_display)
             
@@ -520,15 +577,22 @@ class EtherealApp(ctk.CTk):
             self.after(0, self.update_debug_panels, data.get("payload"), data["duration"], 0)
             
             self.after(0, lambda: self.activity_label.configure(text="[SPEAKING]", text_color="#4ade80"))
-            m_time = self.bot.speak(data["text"])
-            
+
+        # [修改] 思考 + 说话合并为一轮 (流式模式下边想边说)
+        data, m_time = self.bot.think_and_speak(user_text, on_thought=_on_thought, turn=turn)
+        if data:
             # 再次更新面板 (仅更新时间)
             self.after(0, self.update_debug_panels, data.get("payload"), data["duration"], m_time)
+        elif turn.cancelled:
+            if turn.token.reason == "stop":
+                self.after(0, self.add_message, "System", "Stopped.", False)
+            # 被新的输入抢占: 状态由新的一轮接管
+            if turn.token.reason == "preempted":
+                return
         else:
             self.after(0, self.add_message, "System", "Link Lost.", False)
         
         self.after(0, lambda: self.activity_label.configure(text="[IDLE]", text_color="#60a5fa"))
-        self.after(0, lambda: self.entry.configure(state="normal"))
         self.after(0, lambda: self.entry.focus_set())
 
     def on_close(self):
@@ -549,9 +613,24 @@ class EtherealApp(ctk.CTk):
         self.log_box.see("end")
         self.log_box.configure(state="disabled")
 
+    def show_stt_partial(self, text):
+        """用同一行显示增量结果，整句结果到达时由 append_stt_log 替换"""
+        self.stt_box.configure(state="normal")
+        self._clear_stt_partial()
+        self._stt_partial_index = self.stt_box.index("end-1c")
+        self.stt_box.insert("end", f"… {text}\n")
+        self.stt_box.see("end")
+        self.stt_box.configure(state="disabled")
+
+    def _clear_stt_partial(self):
+        if getattr(self, "_stt_partial_index", None):
+            self.stt_box.delete(self._stt_partial_index, "end-1c")
+            self._stt_partial_index = None
+
     def append_stt_log(self, text):
         # Helper for STT logs
         self.stt_box.configure(state="normal")
+        self._clear_stt_partial()
         self.stt_box.insert("end", f"{text}\n")
         self.stt_box.see("end")
         self.stt_box.configure(state="disabled")
@@ -0,0 +1,162 @@
+import re
+import threading
+import config
+from cancellation import CancelledError
+
+_CJK_RE = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+def estimate_tokens(text):
+    """粗略估算 token 数: 中日文约 1 字 1 token，其余约 4 字符 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 4  # +4: 每条消息的角色/分隔开销
+
+
+class HistoryManager:
+    """
+    对话历史管理器 (按 token 预算裁剪)
+    发送给大脑的消息 = 系统提示词 + 滚动摘要 + 最近窗口。
+    窗口超出预算时，把最早的若干轮交给后台线程并入摘要。
+    折叠只在助手回复写入之后开始 (大脑此时空闲)，摘要请求不会和当前这一轮
+    抢本地模型的并发槽位，也不会在请求途中挤掉它的 KV 缓存。
+
+    为了让 Ollama 的 KV 缓存尽量命中，消息前缀保持稳定:
+    - 系统提示词在构造时冻结，之后不再改动
+    - 历史只追加，不改写已发送的内容
+    - 折叠时 "移出旧消息" 与 "更新摘要" 在摘要生成后一次性完成，
+      每次折叠只让前缀失效一次；一次多折叠一些 (low_watermark)，降低折叠频率
+    """
+    def __init__(self, system_prompt, token_budget=4000, summarize_fn=None, low_watermark=0.6,
+                 max_failures=3, hard_limit=2.0):
+        """
+        Args:
+            system_prompt: 系统提示词 (冻结)
+            token_budget: 最近窗口 (不含系统提示词与摘要) 的 token 上限
+            summarize_fn: 摘要函数 summarize_fn(previous_summary, messages) -> str
+            low_watermark: 超出预算时裁剪到预算的多少比例 (一次多裁一些，减少裁剪次数)
+            max_failures: 摘要连续失败多少次后放弃这批消息 (直接移出窗口)
+            hard_limit: 窗口超过预算的多少倍时，摘要失败 / 被取消也直接移出，保证每轮 prefill 有上界
+        """
+        self._system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.summarize_fn = summarize_fn
+        self.low_watermark = low_watermark
+        self.max_failures = max_failures
+        self.hard_limit = hard_limit
+        # 连续失败次数 (被新的一轮取消不算失败)
+        self._failures = 0
+
+        self.summary = ""
+        self._recent = []   # [{"role", "content"}]
+        self._tokens = []   # 与 _recent 一一对应的 token 估算
+        self._lock = threading.Lock()
+
+        # 正在并入摘要的消息条数 (摘要完成前仍留在窗口里)
+        self._folding = 0
+        # clear() 后作废进行中的摘要
+        self._generation = 0
+
+    @property
+    def system_prompt(self):
+        return self._system_prompt
+
+    def append(self, role, content):
+        with self._lock:
+            self._recent.append({"role": role, "content": content})
+            self._tokens.append(estimate_tokens(content))
+            # 用户消息写入后紧接着就是大脑请求，这时不折叠；等这一轮回复完再说
+            if role == "assistant" and not self._folding and sum(self._tokens) > self.token_budget:
+                self._fold_oldest()
+
+    def messages(self):
+        """本轮请求要发送的消息列表"""
+        with self._lock:
+            msgs = [{"role": "system", "content": self._system_prompt}]
+            if self.summary:
+                msgs.append({"role": "system", "content": f"[EARLIER CONVERSATION SUMMARY]\n{self.summary}"})
+            msgs.extend(dict(m) for m in self._recent)
+            return msgs
+
+    def token_count(self):
+        """当前请求的估算 token 数"""
+        with self._lock:
+            return estimate_tokens(self._system_prompt) + estimate_tokens(self.summary) + sum(self._tokens)
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._recent, self._tokens = [], []
+            self._folding = 0
+            self._generation += 1
+
+    def _fold_oldest(self):
+        """选出最早的若干整轮准备折叠 (调用方持有锁)，保证剩余窗口以 user 开头"""
+        target = self.token_budget * self.low_watermark
+        user_starts = [i for i, m in enumerate(self._recent) if m["role"] == "user" and i > 0]
+        if not user_starts:
+            return
+        # 只在 user 处切开: 取第一个能降到目标以下的位置，都不够则切到最后一个 user
+        cut = user_starts[-1]
+        total = sum(self._tokens)
+        removed = 0
+        prev = 0
+        for i in user_starts:
+            removed += sum(self._tokens[prev:i])
+            prev = i
+            if total - removed <= target:
+                cut = i
+                break
+
+        if self.summarize_fn is None:
+            self._drop_oldest(cut)
+            return
+
+        config.console.print(f"[dim]History: folding {cut} messages into summary...[/dim]")
+        self._folding = cut
+        batch = [dict(m) for m in self._recent[:cut]]
+        threading.Thread(
+            target=self._summarize_worker,
+            args=(self.summary, batch, self._generation),
+            daemon=True
+        ).start()
+
+    def _drop_oldest(self, count):
+        self._recent, self._tokens = self._recent[count:], self._tokens[count:]
+
+    def _summarize_worker(self, previous, batch, generation):
+        failed = False
+        try:
+            summary = self.summarize_fn(previous, batch)
+        except CancelledError:
+            # 新的一轮开始，摘要让路
+            config.console.print("[dim]History: summarization postponed (turn started).[/dim]")
+            summary = None
+        except Exception as e:
+            config.console.print(f"[yellow]History summarization failed: {e}[/yellow]")
+            summary = None
+            failed = True
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            if summary is None:
+                if failed:
+                    self._failures += 1
+                if (self._failures < self.max_failures
+                        and sum(self._tokens) <= self.token_budget * self.hard_limit):
+                    # 摘要失败 / 被取消: 这批消息留在窗口里，下一次回复写入后重试
+                    self._folding = 0
+                    return
+                # 一直失败或窗口已经太大: 不带摘要直接移出，保证窗口有上界
+                config.console.print(f"[yellow]History: dropping {self._folding} messages without summary.[/yellow]")
+                self._drop_oldest(self._folding)
+                self._folding = 0
+                self._failures = 0
+                return
+            # 历史只追加，被折叠的消息仍然在窗口最前面
+            self._drop_oldest(self._folding)
+            self._folding = 0
+            self._failures = 0
+            self.summary = summary.strip()
+            # 仍超出预算时不在这里接着折叠 (可能正赶上下一轮请求)，留给下一次回复写入后
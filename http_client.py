@@ -0,0 +1,179 @@
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from cancellation import CancelledError
+
+class BackendClient:
+    """
+    单个后端 (Ollama / DeepSeek / GPT-SoVITS) 的长连接会话
+    - 连接池复用 TCP / TLS 连接，省掉每轮的握手
+    - 按 endpoint 区分超时
+    - 连接失败时带抖动的指数退避重试 (读超时不重试，避免重复生成)
+    """
+    def __init__(self, name, timeouts=None, retries=2, backoff=0.2, pool_size=4):
+        """
+        Args:
+            name: 后端名称
+            timeouts: { endpoint: (connect_timeout, read_timeout) }，"default" 为兜底
+            retries: 连接失败时的最大重试次数
+            backoff: 首次重试的基础等待时间 (秒)
+            pool_size: 连接池大小
+        """
+        self.name = name
+        self.timeouts = timeouts or {}
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self.request_count = 0
+        self.retry_count = 0
+        self.error_count = 0
+        self.cancel_count = 0
+
+    def timeout_for(self, endpoint):
+        return self.timeouts.get(endpoint, self.timeouts.get("default", (3.05, 30)))
+
+    def request(self, method, url, endpoint="default", retries=None, cancel_token=None, **kwargs):
+        """
+        发送请求
+        Args:
+            endpoint: 超时配置的键
+            retries: 覆盖默认重试次数 (如健康探测不需要重试)
+            cancel_token: [新增] 取消令牌。取消时立即抛出 CancelledError，不等服务器返回；
+                          流式响应在取消时自动关闭 (正在读取的线程随之退出)
+        """
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        retries = self.retries if retries is None else retries
+        if cancel_token is None:
+            return self._request(method, url, retries, None, **kwargs)
+
+        cancel_token.raise_if_cancelled()
+        result = {}
+        done = threading.Event()
+        abandoned = threading.Event()
+
+        def _run():
+            try:
+                result["response"] = self._request(method, url, retries, cancel_token, **kwargs)
+            except BaseException as e:
+                result["error"] = e
+            done.set()
+            # 调用方已经放弃: 迟到的响应直接关闭，连接不留给这一轮
+            if abandoned.is_set() and "response" in result:
+                result["response"].close()
+
+        threading.Thread(target=_run, daemon=True).start()
+        unregister = cancel_token.on_cancel(done.set)
+        done.wait()
+        unregister()
+
+        if "response" not in result and "error" not in result:
+            abandoned.set()
+            # 线程可能恰好在 abandoned 设置前完成
+            if "response" in result:
+                result["response"].close()
+            self.cancel_count += 1
+            raise CancelledError(cancel_token.reason)
+        if "error" in result:
+            raise result["error"]
+
+        response = result["response"]
+        if kwargs.get("stream"):
+            self._close_on_cancel(response, cancel_token)
+        return response
+
+    @staticmethod
+    def _close_on_cancel(response, cancel_token):
+        """
+        流式响应: 取消时关闭连接；调用方读完后 close() 时注销回调，
+        令牌上不会越攒越多已经用完的响应
+        """
+        close = response.close
+        unregister = cancel_token.on_cancel(close)
+
+        def _close():
+            unregister()
+            close()
+
+        response.close = _close
+
+    def _request(self, method, url, retries, cancel_token, **kwargs):
+        """带重试的请求本体"""
+        for attempt in range(retries + 1):
+            try:
+                self.request_count += 1
+                return self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                # ConnectTimeout 也属于 ConnectionError；ReadTimeout 不在此列
+                if attempt >= retries:
+                    self.error_count += 1
+                    raise
+                self.retry_count += 1
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if cancel_token is not None:
+                    if cancel_token.wait(delay):
+                        raise CancelledError(cancel_token.reason)
+                else:
+                    time.sleep(delay)
+            except requests.RequestException:
+                self.error_count += 1
+                raise
+
+    def get(self, url, endpoint="default", **kwargs):
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint="default", **kwargs):
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def stats(self):
+        """连接复用统计: 新建连接数 vs 总请求数"""
+        new_connections = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            new_connections += pool.num_connections
+            pool_requests += pool.num_requests
+        return {
+            "requests": self.request_count,
+            "retries": self.retry_count,
+            "errors": self.error_count,
+            "cancelled": self.cancel_count,
+            "new_connections": new_connections,
+            "reused_connections": max(0, pool_requests - new_connections)
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(name):
+    """获取 (或创建) 指定后端的共享客户端，超时配置见 config.HTTP_TIMEOUTS"""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = BackendClient(name, timeouts=config.HTTP_TIMEOUTS.get(name, {}))
+            _clients[name] = client
+        return client
+
+def all_stats():
+    with _clients_lock:
+        return {name: client.stats() for name, client in _clients.items()}
+
+def close_all():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
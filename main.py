@@ -1,3 +1,4 @@
+import startup  # 最先导入: 记录进程启动时间，供启动剖析使用
 from gui import EtherealApp
 import config
 
@@ -9,6 +10,7 @@ def main():
     
     # 实例化并运行图形界面
     # 所有的逻辑现在由 gui.py 接管
+    startup.mark("gui imported")
     app = EtherealApp()
     
     # 这一步会阻塞，直到窗口关闭
@@ -0,0 +1,132 @@
+import os
+import shutil
+import zipfile
+import tempfile
+import requests
+import config
+from startup import timed_import
+
+class ModelStore:
+    """
+    本地模型仓库 (离线优先)
+    目录结构 (版本固定，见 config):
+        models/silero-vad/<tag>/              silero-vad 仓库快照 (自带 TorchScript .jit 与 .onnx)
+        models/SenseVoiceSmall/<revision>/    SenseVoiceSmall 模型文件
+    每个目录下载完整后才写入 .complete 标记，半截下载不会被当成可用模型。
+    加载时直接读本地文件，不经过 torch.hub / ModelScope 的版本解析。
+    """
+    COMPLETE_MARK = ".complete"
+    # silero-vad 各版本中序列化模型的相对位置
+    SILERO_LAYOUTS = [
+        os.path.join("src", "silero_vad", "data"),
+        "files",
+    ]
+
+    def __init__(self, root=None, offline=None):
+        """
+        Args:
+            root: 仓库根目录，默认 config.MODEL_DIR
+            offline: True 时缺模型直接报错；默认 config.MODEL_OFFLINE
+        """
+        self.root = root or config.MODEL_DIR
+        self.offline = config.MODEL_OFFLINE if offline is None else offline
+
+    # --- Silero VAD ---
+    def silero_vad_dir(self):
+        return os.path.join(self.root, "silero-vad", config.SILERO_VAD_VERSION)
+
+    def silero_vad_file(self, fmt="jit"):
+        """序列化模型文件路径 (fmt: jit / onnx)，不存在时返回 None"""
+        base = self.silero_vad_dir()
+        for layout in self.SILERO_LAYOUTS:
+            path = os.path.join(base, layout, f"silero_vad.{fmt}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def ensure_silero_vad(self):
+        target = self.silero_vad_dir()
+        if not self._is_complete(target):
+            self._require_online("Silero VAD", config.SILERO_VAD_VERSION)
+            url = f"https://github.com/snakers4/silero-vad/archive/refs/tags/{config.SILERO_VAD_VERSION}.zip"
+            self._fetch_zip(url, target)
+        return target
+
+    def load_silero_vad(self, device="cpu"):
+        """直接反序列化 TorchScript 模型，跳过 hubconf"""
+        self.ensure_silero_vad()
+        path = self.silero_vad_file("jit")
+        if path is None:
+            raise FileNotFoundError(f"silero_vad.jit not found under {self.silero_vad_dir()}")
+        torch = timed_import("torch")
+        model = torch.jit.load(path, map_location=device)
+        model.eval()
+        return model
+
+    # --- SenseVoiceSmall ---
+    def sensevoice_dir(self):
+        return os.path.join(self.root, "SenseVoiceSmall", config.SENSEVOICE_REVISION)
+
+    def ensure_sensevoice(self):
+        target = self.sensevoice_dir()
+        if not self._is_complete(target):
+            self._require_online("SenseVoiceSmall", config.SENSEVOICE_REVISION)
+            snapshot_download = timed_import("modelscope.hub.snapshot_download").snapshot_download
+            tmp = self._staging_dir(target)
+            try:
+                snapshot_download(config.SENSEVOICE_MODEL_ID, revision=config.SENSEVOICE_REVISION, local_dir=tmp)
+                self._commit(tmp, target)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        return target
+
+    # --- Helpers ---
+    def _is_complete(self, path):
+        return os.path.exists(os.path.join(path, self.COMPLETE_MARK))
+
+    def _require_online(self, name, version):
+        if self.offline:
+            raise FileNotFoundError(
+                f"{name} {version} is not in the local model store ({self.root}). "
+                f"Run `python model_store.py` on a machine with network access and copy the folder over."
+            )
+        config.console.print(f"[yellow]Model store: downloading {name} {version} (one-time)...[/yellow]")
+
+    def _staging_dir(self, target):
+        parent = os.path.dirname(target)
+        os.makedirs(parent, exist_ok=True)
+        return tempfile.mkdtemp(prefix=".staging-", dir=parent)
+
+    def _commit(self, staged, target):
+        """整体替换目标目录并写入完成标记"""
+        with open(os.path.join(staged, self.COMPLETE_MARK), "w", encoding="utf-8") as f:
+            f.write(os.path.basename(target))
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(staged, target)
+
+    def _fetch_zip(self, url, target):
+        tmp = self._staging_dir(target)
+        try:
+            archive = os.path.join(tmp, "archive.zip")
+            with requests.get(url, stream=True, timeout=(5, 60)) as resp:
+                resp.raise_for_status()
+                with open(archive, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=1 << 16):
+                        f.write(chunk)
+            extract_dir = os.path.join(tmp, "extract")
+            with zipfile.ZipFile(archive) as zf:
+                zf.extractall(extract_dir)
+            # GitHub 归档里只有一个顶层目录 (如 silero-vad-5.1.2/)
+            entries = os.listdir(extract_dir)
+            root = os.path.join(extract_dir, entries[0]) if len(entries) == 1 else extract_dir
+            self._commit(root, target)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # 预先下载全部固定版本的模型 (之后可设置 MODEL_OFFLINE = True 完全离线运行)
+    store = ModelStore(offline=False)
+    config.console.print(f"Silero VAD      -> {store.ensure_silero_vad()}")
+    config.console.print(f"SenseVoiceSmall -> {store.ensure_sensevoice()}")
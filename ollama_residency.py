@@ -0,0 +1,113 @@
+import time
+import threading
+import config
+
+class OllamaResidencyManager:
+    """
+    本地 Ollama 模型常驻管理
+    - 后台预热，不阻塞启动
+    - 显式设置 keep_alive，空闲时定期发送轻量 keep-warm 请求，防止模型被卸载
+    - 只有在切换大脑或退出时才主动卸载
+    状态: cold -> warming -> warm (-> unloaded)
+    """
+    def __init__(self, http, model, keep_alive="30m", ping_interval=240, on_state_change=None):
+        """
+        Args:
+            http: ollama 的 BackendClient
+            model: 模型名称
+            keep_alive: 每次请求携带的 keep_alive (Ollama 时长格式，如 "30m"，-1 表示永久)
+            ping_interval: 空闲多久 (秒) 发送一次 keep-warm 请求
+            on_state_change: 状态变化回调 on_state_change(state)
+        """
+        self.http = http
+        self.model = model
+        self.keep_alive = keep_alive
+        self.ping_interval = ping_interval
+        self.on_state_change = on_state_change
+
+        self.state = "cold"
+        self.last_activity = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_cold(self):
+        return self.state != "warm"
+
+    def start(self):
+        """后台预热并开始保活"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def touch(self):
+        """记录一次真实请求 (请求本身会携带 keep_alive 续期)"""
+        self.last_activity = time.time()
+
+    def wake(self):
+        """模型处于 cold 时立即在后台重新加载 (例如用户刚开始说话)"""
+        if self.state != "cold" or self._thread is None or self._stop.is_set():
+            return
+        threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self):
+        self._set_state("warming")
+        try:
+            self._load_request("warmup")
+            self.last_activity = time.time()
+            self._set_state("warm")
+        except Exception:
+            self._set_state("cold")
+
+    def stop(self):
+        """停止保活 (不卸载模型)"""
+        self._stop.set()
+
+    def unload(self):
+        """停止保活并让 Ollama 立即卸载模型 (切换大脑 / 退出时调用)"""
+        self.stop()
+        try:
+            self.http.post(config.OLLAMA_URL, endpoint="unload", retries=0,
+                           json={"model": self.model, "keep_alive": 0})
+        except Exception:
+            pass
+        self._set_state("unloaded")
+
+    def _load_request(self, endpoint):
+        # messages 为空时 Ollama 只加载模型，不做生成
+        resp = self.http.post(config.OLLAMA_URL, endpoint=endpoint,
+                              json={"model": self.model, "messages": [], "keep_alive": self.keep_alive})
+        resp.raise_for_status()
+
+    def _run(self):
+        self._set_state("warming")
+        config.console.print("[dim]预热本地神经网络...[/dim]")
+        try:
+            st = time.time()
+            self._load_request("warmup")
+            self.last_activity = time.time()
+            self._set_state("warm")
+            config.console.print(f"[green]✔ Ollama model resident ({time.time() - st:.1f}s)[/green]")
+        except Exception as e:
+            config.console.print(f"[yellow]⚠ Ollama warmup failed: {e}[/yellow]")
+            self._set_state("cold")
+
+        while not self._stop.wait(self.ping_interval / 4):
+            if time.time() - self.last_activity < self.ping_interval:
+                continue
+            try:
+                self._load_request("warmup")
+                self.last_activity = time.time()
+                self._set_state("warm")
+            except Exception:
+                # Ollama 没有响应，下次对话会冷启动
+                self._set_state("cold")
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        if self.on_state_change:
+            self.on_state_change(state)
@@ -0,0 +1,88 @@
+import re
+
+# 句末标点 (中英文)
+SENTENCE_END_CHARS = "。！？!?；;…\n"
+
+class SentenceSplitter:
+    """
+    增量分句器 (配合流式大脑)
+    逐 token 喂入文本，凑齐一句就吐出一句，供 TTS 提前开始合成。
+    括号 / 星号动作描述内部不会被切断，避免清洗时把半截动作念出来。
+    """
+    def __init__(self, min_chars=4):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """喂入新 token，返回本次凑齐的完整句子列表"""
+        self.buffer += text
+        sentences = []
+        while True:
+            cut = self._find_cut(self.buffer)
+            if cut is None:
+                break
+            sentence, self.buffer = self.buffer[:cut], self.buffer[cut:]
+            if sentence.strip():
+                sentences.append(sentence.strip())
+        return sentences
+
+    def flush(self):
+        """流结束时吐出剩余文本"""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+    def _find_cut(self, text):
+        depth = 0
+        in_action = False
+        for i, ch in enumerate(text):
+            if ch in "（([":
+                depth += 1
+            elif ch in "）)]":
+                depth = max(0, depth - 1)
+            elif ch == "*":
+                in_action = not in_action
+            elif depth == 0 and not in_action and self._is_sentence_end(text, i):
+                end = i + 1
+                # 连续标点 (如 "！！" "……" "?!") 一并带走
+                while end < len(text) and text[end] in SENTENCE_END_CHARS:
+                    end += 1
+                if end == len(text) and text[i] in ".…":
+                    # 可能是省略号的一部分，等下一个 token
+                    return None
+                if len(text[:end].strip()) >= self.min_chars:
+                    return end
+        return None
+
+    def _is_sentence_end(self, text, i):
+        ch = text[i]
+        if ch in SENTENCE_END_CHARS:
+            return True
+        # 英文句号: 后面跟空白才算句末 (避免切断 3.14 / e.g.)
+        return ch == "." and i + 1 < len(text) and text[i + 1].isspace()
+
+
+def split_sentences(text, min_chars=4):
+    """一次性把整段文本切成句子列表"""
+    splitter = SentenceSplitter(min_chars=min_chars)
+    sentences = splitter.feed(text)
+    sentences.extend(splitter.flush())
+    return sentences
+
+
+def strip_emotion_prefix(text):
+    """
+    从流式文本开头解析 [emotion] 标签
+    Returns: (emotion, rest) 已确定; (None, text) 还需要更多 token
+    """
+    stripped = text.lstrip()
+    if not stripped:
+        return None, text
+    if not stripped.startswith("["):
+        return "neutral", text
+    match = re.match(r'^\[(\w+)\]\s*(.*)', stripped, re.DOTALL)
+    if match:
+        return match.group(1).lower(), match.group(2)
+    if "]" in stripped or len(stripped) > 32:
+        # 不是合法的情感标签，按普通文本处理
+        return "neutral", text
+    return None, text
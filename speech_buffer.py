@@ -0,0 +1,142 @@
+import queue
+import threading
+import numpy as np
+import config
+
+class SpeechSegment:
+    """一句话的音频 (预分配槽位上的零拷贝视图)，识别完成后调用 release() 归还槽位"""
+    def __init__(self, slot, length, pool, utterance_id=0, voiced_length=None):
+        self.audio = slot[:length]
+        self.utterance_id = utterance_id
+        # 最后一个有声帧结束处 (之后是句尾静音)
+        self.voiced_length = length if voiced_length is None else voiced_length
+        self._slot = slot
+        self._pool = pool
+
+    @property
+    def duration(self):
+        return len(self.audio)
+
+    def release(self):
+        if self._slot is not None:
+            self._pool.put_nowait(self._slot)
+            self._slot = None
+
+
+class SpeechBuffer:
+    """
+    语音分段缓冲区 (float32，全部预分配)
+    - 预滚动: 一个小的环形缓冲区，持续保存语音起点之前的音频
+    - 句子槽位: 固定数量、每个容纳 max_samples 的数组，轮流使用；
+      一句话写满上限时由调用方强制切段
+    交给识别线程的是槽位上的视图，整个过程不再按句分配内存。
+    """
+    def __init__(self, max_samples, preroll_samples, slots=6):
+        """
+        Args:
+            max_samples: 单句最大采样点数 (超过即强制切段)
+            preroll_samples: 预滚动采样点数
+            slots: 槽位数，应不少于 识别队列容量 + 2 (正在写入的一句 + 正在识别的一句)
+        """
+        self.max_samples = int(max_samples)
+        self.preroll = np.zeros(max(1, int(preroll_samples)), dtype=np.float32)
+        self._preroll_pos = 0   # 累计写入的预滚动采样点数
+
+        self._pool = queue.Queue()
+        for _ in range(slots):
+            self._pool.put_nowait(np.zeros(self.max_samples, dtype=np.float32))
+
+        self._slot = None
+        self._length = 0
+        self._voiced_length = 0
+        self.utterance_id = 0
+        # 保护槽位切换，供 peek() 在其他线程读取正在录制的句子
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self._slot is not None
+
+    @property
+    def length(self):
+        return self._length
+
+    @property
+    def voiced_length(self):
+        return self._voiced_length
+
+    def push_preroll(self, frame):
+        """未在说话时调用: 把一帧写入预滚动环形缓冲区"""
+        cap = len(self.preroll)
+        frame = frame[-cap:]
+        start = self._preroll_pos % cap
+        first = min(len(frame), cap - start)
+        self.preroll[start:start + first] = frame[:first]
+        if len(frame) > first:
+            self.preroll[:len(frame) - first] = frame[first:]
+        self._preroll_pos += len(frame)
+
+    def begin(self, with_preroll=True):
+        """开始一句话: 取一个空闲槽位，并按时间顺序写入预滚动音频"""
+        try:
+            slot = self._pool.get_nowait()
+        except queue.Empty:
+            # 按槽位数配置不应发生；兜底临时分配一个
+            config.console.print("[yellow]SpeechBuffer: no free slot, allocating.[/yellow]")
+            slot = np.zeros(self.max_samples, dtype=np.float32)
+        with self._lock:
+            self._slot = slot
+            self._length = 0
+            self._voiced_length = 0
+            self.utterance_id += 1
+
+        if with_preroll and self._preroll_pos:
+            cap = len(self.preroll)
+            n = min(cap, self._preroll_pos)
+            start = (self._preroll_pos - n) % cap
+            first = min(n, cap - start)
+            self._slot[:first] = self.preroll[start:start + first]
+            self._slot[first:n] = self.preroll[:n - first]
+            self._length = n
+        self._preroll_pos = 0
+
+    def append(self, frame):
+        """
+        追加一帧到当前句子
+        Returns: 写满上限时返回 True (调用方应立即 finish 并切段)
+        """
+        n = min(len(frame), self.max_samples - self._length)
+        self._slot[self._length:self._length + n] = frame[:n]
+        self._length += n
+        return self._length >= self.max_samples
+
+    def mark_voiced(self):
+        """当前帧为有声帧: 有声部分延伸到当前长度"""
+        self._voiced_length = self._length
+
+    def peek(self):
+        """
+        正在录制的句子的有声部分 (零拷贝视图，供增量识别)
+        Returns: (utterance_id, audio)；未在录制时返回 None
+        """
+        with self._lock:
+            if self._slot is None:
+                return None
+            return self.utterance_id, self._slot[:self._voiced_length]
+
+    def finish(self):
+        """结束当前句子，返回 SpeechSegment (零拷贝)"""
+        with self._lock:
+            segment = SpeechSegment(self._slot, self._length, self._pool, self.utterance_id, self._voiced_length)
+            self._slot = None
+            self._length = 0
+        return segment
+
+    def discard(self):
+        """放弃当前句子 (如静音开关关闭)，归还槽位"""
+        with self._lock:
+            if self._slot is not None:
+                self._pool.put_nowait(self._slot)
+            self._slot = None
+            self._length = 0
+        self._preroll_pos = 0
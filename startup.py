@@ -0,0 +1,108 @@
+import sys
+import time
+import importlib
+import threading
+from concurrent.futures import Future
+import config
+
+# 进程启动基准时间 (main.py 最先导入本模块)
+PROCESS_START = time.perf_counter()
+# 重型依赖的导入耗时 { module_name: seconds }
+IMPORT_TIMES = {}
+# 启动里程碑 [(label, seconds_since_start)]
+_milestones = []
+
+def timed_import(module_name):
+    """
+    导入模块并记录耗时 (供各引擎的延迟加载函数使用)
+    并发导入同一模块时由 importlib 的模块锁保证只初始化一次，只记录第一次的耗时。
+    """
+    already_loaded = module_name in sys.modules
+    st = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if not already_loaded:
+        IMPORT_TIMES.setdefault(module_name, time.perf_counter() - st)
+    return module
+
+def mark(label):
+    """记录一个启动里程碑 (如 first paint / bot ready)"""
+    _milestones.append((label, time.perf_counter() - PROCESS_START))
+
+def profile_report():
+    """启动剖析报告: 里程碑时间线 + 按耗时排序的导入明细"""
+    lines = ["Startup profile:"]
+    for label, t in _milestones:
+        lines.append(f"  {t * 1000:8.0f} ms  {label}")
+    for name, t in sorted(IMPORT_TIMES.items(), key=lambda kv: kv[1], reverse=True):
+        lines.append(f"  import {name:<16} {t * 1000:8.0f} ms")
+    return "\n".join(lines)
+
+class StartupGraph:
+    """
+    依赖感知的并行启动器
+    每个组件在自己的线程里初始化，依赖的组件就绪后才开始；
+    每个组件对应一个 Future，就绪时回调通知 (供 GUI 点亮状态灯)。
+    总启动时间约等于最长的那条依赖链，而不是所有组件之和。
+    """
+    def __init__(self, on_component_ready=None):
+        """
+        Args:
+            on_component_ready: 组件完成回调 on_component_ready(name, result, elapsed, error)
+        """
+        self.on_component_ready = on_component_ready
+        self.futures = {}
+        self.timings = {}
+        self._tasks = []
+        self._start_time = None
+        self.total_time = 0.0
+
+    def add(self, name, fn, deps=()):
+        """注册组件: fn() 的返回值作为 Future 的结果"""
+        self.futures[name] = Future()
+        self._tasks.append((name, fn, tuple(deps)))
+
+    def run(self):
+        self._start_time = time.time()
+        for name, fn, deps in self._tasks:
+            threading.Thread(target=self._run_task, args=(name, fn, deps),
+                             name=f"startup-{name}", daemon=True).start()
+        return self.futures
+
+    def _run_task(self, name, fn, deps):
+        future = self.futures[name]
+        try:
+            for dep in deps:
+                # 依赖失败时本组件也视为失败
+                self.futures[dep].result()
+            st = time.time()
+            result = fn()
+            self.timings[name] = time.time() - st
+            future.set_result(result)
+            error = None
+        except Exception as e:
+            self.timings.setdefault(name, 0.0)
+            future.set_exception(e)
+            result, error = None, e
+
+        if self.on_component_ready:
+            try:
+                self.on_component_ready(name, result, self.timings[name], error)
+            except Exception as e:
+                config.console.print(f"[red]Startup callback error ({name}): {e}[/red]")
+
+    def wait(self, timeout=None):
+        """等待全部组件完成；有组件失败时抛出第一个异常"""
+        first_error = None
+        for name, _, _ in self._tasks:
+            error = self.futures[name].exception(timeout)
+            if error is not None and first_error is None:
+                first_error = error
+        self.total_time = time.time() - self._start_time
+        if first_error is not None:
+            raise first_error
+
+    def report(self):
+        """启动耗时报告"""
+        parts = [f"{name} {self.timings.get(name, 0.0):.2f}s" for name, _, _ in self._tasks]
+        serial = sum(self.timings.values())
+        return f"Startup: {' | '.join(parts)} | total {self.total_time:.2f}s (serial {serial:.2f}s)"
@@ -4,13 +4,31 @@ import threading
 import queue
 import re
 import numpy as np
-import pyaudio
-import torch
-from funasr import AutoModel
 from rich.console import Console
+import config
+from startup import timed_import
+from model_store import ModelStore
+from vad_backends import create_vad, GatedVAD
+from speech_buffer import SpeechBuffer
+from asr_backends import create_asr
+from endpointer import Endpointer
+from echo_canceller import EchoCanceller
+from audio_output import resample
 
 console = Console()
 
+# [修改] torch / funasr / pyaudio 延迟到后台加载线程里导入 (见 _load_backends 与 asr_backends)，
+# 这样 GUI 不必等待它们就能先绘制出来
+torch = None
+pyaudio = None
+
+def _load_backends():
+    global torch, pyaudio
+    if pyaudio is not None:
+        return
+    torch = timed_import("torch")
+    pyaudio = timed_import("pyaudio")
+
 class STTEngine:
     """
     Speech-to-Text Engine using SenseVoiceSmall (via FunASR) and Silero VAD.
@@ -46,10 +64,29 @@ class STTEngine:
                                  Signature: callback(perception_data)
             device (str): Device to run models on ("cuda" or "cpu").
         """
+        _load_backends()
         self.callback = callback
         self.is_running = False
         self.is_listening_active = True
-        self.audio_queue = queue.Queue()
+        # [修改] 采集回调 -> audio_queue -> 分段线程 -> asr_queue -> 识别线程，队列有界
+        self.audio_queue = queue.Queue(maxsize=config.STT_AUDIO_QUEUE_SIZE)
+        self.asr_queue = queue.Queue(maxsize=config.STT_ASR_QUEUE_SIZE)
+        self.stream = None
+        # 溢出计数: 声卡输入溢出 / 采集队列满丢块 / 识别队列满丢句
+        self.input_overflows = 0
+        self.capture_dropped = 0
+        self.asr_dropped = 0
+        # [新增] 增量识别: 最近一次 partial 的 (utterance_id, 已识别采样点数, 原始文本)
+        self._partial = None
+        self.partial_reused = 0
+        # 增量识别与整句识别共用一个模型，推理互斥
+        self._asr_lock = threading.Lock()
+        # [新增] 全双工: 回声消除 + 插话检测 (见 enable_echo_cancellation)
+        self.aec = None
+        self.echo_reference = None
+        self.playback_active = None
+        self.on_barge_in = None
+        self.barge_in_count = 0
         
         # Audio configuration
         self.FORMAT = pyaudio.paInt16
@@ -61,13 +98,27 @@ class STTEngine:
         self.vad_threshold = 0.5
         self.silence_duration_threshold = 0.8
         self.min_speech_duration_ms = 250
+        self.preroll_frames = max(1, -(-config.STT_PREROLL_MS * self.RATE // (1000 * self.CHUNK)))
+        # [新增] 自适应断句 (静音等待时长随增量识别文本 / VAD 走势 / 句长调整)
+        self.endpointer = Endpointer(
+            base_silence=self.silence_duration_threshold,
+            min_silence=config.STT_ENDPOINT_MIN_SILENCE,
+            max_silence=config.STT_ENDPOINT_MAX_SILENCE,
+            frame_seconds=self.CHUNK / self.RATE
+        )
+        # [新增] 预分配的语音缓冲区 (预滚动 + 固定数量的整句槽位)
+        self.speech = SpeechBuffer(
+            max_samples=int(config.STT_MAX_UTTERANCE_S * self.RATE),
+            preroll_samples=self.preroll_frames * self.CHUNK,
+            slots=config.STT_ASR_QUEUE_SIZE + 2
+        )
         
         console.log(f"[bold green]Initializing STT Engine (SenseVoiceSmall)...[/bold green]")
 
         # Check CUDA availability
         if device == "cuda" and not torch.cuda.is_available():
             console.print("[bold yellow]Warning: CUDA requested but Torch not compiled with CUDA enabled or no GPU found.[/bold yellow]")
-            console.print("[yellow]Falling back to CPU. This will be slower.[/yellow]")
+            console.print(f"[yellow]Falling back to CPU ({config.STT_CPU_BACKEND}, {config.STT_CPU_THREADS} threads).[/yellow]")
             device = "cpu"
         
         self.device = device
@@ -85,45 +136,198 @@ class STTEngine:
     def _init_models(self, device):
         """Initialize all AI models."""
         
-        # 1. Load Silero VAD
+        # [修改] 模型从本地仓库加载 (版本固定，不经过 hub 解析，可完全离线)
+        store = ModelStore()
+
+        # 1. Load Silero VAD ([修改] 默认走 ONNX Runtime，显式保存递归状态)
         console.log(f"Loading Silero VAD model on {self.vad_device}...")
-        self.vad_model, utils = torch.hub.load(
-            repo_or_dir='snakers4/silero-vad',
-            model='silero_vad',
-            force_reload=False,
-            onnx=False
+        self.vad = create_vad(
+            store, backend=config.STT_VAD_BACKEND, sample_rate=self.RATE,
+            frame_size=self.CHUNK, device=self.vad_device, threads=config.STT_VAD_THREADS
         )
-        (self.get_speech_timestamps, self.save_audio, self.read_audio, self.VADIterator, self.collect_chunks) = utils
-        self.vad_model.to(self.vad_device)
-        console.log("[green]Silero VAD loaded.[/green]")
+        # [新增] 闸门 -> VAD 级联: 静音和平稳底噪不再调用神经网络
+        self.vad = GatedVAD(self.vad, preroll_frames=self.preroll_frames, enabled=config.STT_ENERGY_GATE)
+        console.log(f"[green]Silero VAD loaded ({self.vad.name}).[/green]")
 
         # 2. Load SenseVoiceSmall (ASR & Events)
         console.log(f"Loading SenseVoiceSmall on {device}...")
-        # disable_update=True to avoid checking for updates at runtime
-        self.asr_model = AutoModel(
-            model="iic/SenseVoiceSmall",
-            device=device,
-            disable_update=True,
-            hub="ms", # Use ModelScope
-            log_level="ERROR"
+        # [修改] CPU 上使用 int8 推理 + 固定线程数，加载后预热一次
+        self.asr = create_asr(
+            store.ensure_sensevoice(), device=device,
+            cpu_backend=config.STT_CPU_BACKEND, threads=config.STT_CPU_THREADS
         )
-        console.log("[green]SenseVoiceSmall online.[/green]")
+        console.log(f"[green]SenseVoiceSmall online ({self.asr.name}).[/green]")
         
         console.log("[bold green]All systems initialized.[/bold green]")
 
     def start_listening(self):
-        """Start the audio recording and processing thread."""
+        """Start audio capture plus the segmentation and ASR worker threads."""
+        batch = max(1, config.STT_VAD_BATCH_FRAMES)
+        try:
+            # [修改] 回调模式采集: 声卡线程只负责把数据放进队列，永远不会被推理阻塞
+            self.stream = self.p.open(format=self.FORMAT,
+                                      channels=self.CHANNELS,
+                                      rate=self.RATE,
+                                      input=True,
+                                      frames_per_buffer=self.CHUNK * batch,
+                                      stream_callback=self._on_audio)
+        except OSError as e:
+            console.print(f"[bold red]Could not open microphone:[/bold red] {e}")
+            return
+
         self.is_running = True
         self.processing_thread = threading.Thread(target=self._process_audio, daemon=True)
         self.processing_thread.start()
+        self.asr_thread = threading.Thread(target=self._asr_worker, daemon=True)
+        self.asr_thread.start()
+        if config.STT_PARTIAL_INTERVAL_MS > 0:
+            self.partial_thread = threading.Thread(target=self._partial_worker, daemon=True)
+            self.partial_thread.start()
+        self.stream.start_stream()
         console.log("[bold cyan]STT Engine started listening...[/bold cyan]")
 
     def stop_listening(self):
-        """Stop the listening thread."""
+        """Stop capture and the worker threads."""
         self.is_running = False
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
         if hasattr(self, 'processing_thread'):
             self.processing_thread.join()
+        if hasattr(self, 'asr_thread'):
+            self._put_asr(None)
+            self.asr_thread.join()
+        if hasattr(self, 'partial_thread'):
+            self.partial_thread.join()
         self.p.terminate()
+        console.log(f"[dim]STT stats: {self.stats()}[/dim]")
+
+    def stats(self):
+        """流水线溢出统计"""
+        return {
+            "input_overflows": self.input_overflows,
+            "capture_dropped": self.capture_dropped,
+            "asr_dropped": self.asr_dropped,
+            "audio_queue": self.audio_queue.qsize(),
+            "asr_queue": self.asr_queue.qsize(),
+            "partial_reused": self.partial_reused,
+            "barge_ins": self.barge_in_count,
+            "vad_skip_ratio": round(self.vad.skip_ratio(), 3),
+            "endpointing": self.endpointer.stats()
+        }
+
+    def _fresh_partial_text(self):
+        """最近一次增量识别如果覆盖到当前句子的最后一个有声帧，返回其文本"""
+        partial = self._partial
+        if not partial or partial[0] != self.speech.utterance_id or partial[1] < self.speech.voiced_length:
+            return None
+        return re.sub(r'<\|.*?\|>', '', partial[2]).strip() or None
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        """PyAudio 采集回调 (声卡线程): 只入队，不做任何处理"""
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        try:
+            # 记录采集时刻，回声消除据此对齐参考信号
+            self.audio_queue.put_nowait((in_data, time.monotonic()))
+        except queue.Full:
+            self.capture_dropped += 1
+        return (None, pyaudio.paContinue)
+
+    def _put_asr(self, item):
+        """放入识别队列；满时丢弃最旧的一句 (过时的话不如最新的话重要)"""
+        while True:
+            try:
+                self.asr_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    dropped = self.asr_queue.get_nowait()
+                    if dropped is not None:
+                        dropped.release()
+                    self.asr_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _asr_worker(self):
+        """识别线程: 逐句运行 SenseVoice"""
+        while True:
+            segment = self.asr_queue.get()
+            if segment is None:
+                break
+            try:
+                self._process_buffer(segment)
+            finally:
+                segment.release()
+
+    def _partial_worker(self):
+        """
+        增量识别线程: 说话过程中定期重新识别正在增长的句子，发出 partial 事件。
+        句尾静音期间通常就能把有声部分识别完，整句识别时可以直接复用。
+        """
+        interval = config.STT_PARTIAL_INTERVAL_MS / 1000.0
+        min_samples = int(config.STT_PARTIAL_MIN_MS * self.RATE / 1000)
+        while self.is_running:
+            time.sleep(interval)
+            if not self.is_listening_active:
+                continue
+            snapshot = self.speech.peek()
+            if snapshot is None:
+                continue
+            utterance_id, audio = snapshot
+            last = self._partial
+            if len(audio) < min_samples or (last and last[0] == utterance_id and last[1] >= len(audio)):
+                continue
+            try:
+                with self._asr_lock:
+                    raw_sensevoice = self.asr.transcribe(audio)
+            except Exception as e:
+                console.print(f"[red]Partial transcription error:[/red] {e}")
+                continue
+            changed = not last or last[0] != utterance_id or last[2] != raw_sensevoice
+            self._partial = (utterance_id, len(audio), raw_sensevoice)
+            if changed:
+                self._parse_and_callback(raw_sensevoice, partial=True)
+
+    def enable_echo_cancellation(self, reference, playback_active, on_barge_in=None):
+        """
+        [新增] 全双工模式: 说话时耳朵不再关闭
+        麦克风信号先经过回声消除 (以扬声器实际播放的音频为参考) 再进入 VAD；
+        播放期间检测到用户持续说话即触发插话回调。
+
+        Args:
+            reference: audio_output.ReferenceTap
+            playback_active: 返回当前是否在播放的函数
+            on_barge_in: 插话回调 on_barge_in() (在独立线程中调用)
+        """
+        self.echo_reference = reference
+        self.playback_active = playback_active
+        self.on_barge_in = on_barge_in
+        self.aec = EchoCanceller(block=self.CHUNK)
+        console.log("[cyan]Full-duplex listening enabled (AEC + barge-in).[/cyan]")
+
+    def _cancel_echo(self, frames, captured_at):
+        """对一个采集块逐帧做回声消除 (原地修改 frames)"""
+        ref_tap = self.echo_reference
+        end = ref_tap.position_at(captured_at)
+        if end is None:
+            return
+        n = frames.size
+        ratio = ref_tap.sample_rate / self.RATE
+        n_ref = int(round(n * ratio))
+        ref = resample(ref_tap.read(end - n_ref, n_ref), ref_tap.sample_rate, self.RATE)
+        if len(ref) != n:
+            ref = np.resize(ref, n)
+        ref = ref.reshape(frames.shape)
+        for i in range(len(frames)):
+            frames[i] = self.aec.process(frames[i], ref[i])
+
+    def _fire_barge_in(self):
+        self.barge_in_count += 1
+        console.log("[bold yellow]Barge-in detected.[/bold yellow]")
+        if self.on_barge_in:
+            threading.Thread(target=self.on_barge_in, daemon=True).start()
 
     def set_listening_active(self, active: bool):
         """Enable or disable VAD processing."""
@@ -132,100 +336,115 @@ class STTEngine:
         console.log(f"[yellow]STT Listening is now {status}[/yellow]")
 
     def _process_audio(self):
-        """Main loop for capturing and processing audio."""
-        try:
-            stream = self.p.open(format=self.FORMAT,
-                                 channels=self.CHANNELS,
-                                 rate=self.RATE,
-                                 input=True,
-                                 frames_per_buffer=self.CHUNK)
-        except OSError as e:
-            console.print(f"[bold red]Could not open microphone:[/bold red] {e}")
-            return
-
-        speech_buffer = []
-        silence_start_time = None
-        is_speaking = False
+        """分段线程: 从 audio_queue 取采集块，VAD 判断后把整句交给识别线程"""
+        speech = self.speech
+        # 静音时长按采样点计算，不受队列积压影响
+        silence_samples = 0
+        endpointer = self.endpointer
+        # [新增] 插话检测: 播放期间连续多少帧语音才算插话
+        barge_in_frames = max(1, int(config.STT_BARGE_IN_MS * self.RATE / 1000 / self.CHUNK))
+        voiced_run = 0
+        barged_in = False
         
         console.log("Microphone stream opened. Waiting for voice...")
 
         while self.is_running:
             try:
-                data = stream.read(self.CHUNK, exception_on_overflow=False)
+                try:
+                    data, captured_at = self.audio_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
                 
                 if not self.is_listening_active:
-                    if speech_buffer:
-                        speech_buffer = []
-                        is_speaking = False
-                        silence_start_time = None
+                    if speech.active:
+                        silence_samples = 0
+                        self.vad.reset()
+                    speech.discard()
                     continue
 
-                audio_chunk = np.frombuffer(data, dtype=np.int16)
-                audio_float32 = audio_chunk.astype(np.float32) / 32768.0
-                
-                with torch.no_grad():
-                    speech_prob = self.vad_model(torch.from_numpy(audio_float32).to(self.vad_device), self.RATE).item()
-
-                current_time = time.time()
-
-                if speech_prob > self.vad_threshold:
-                    if not is_speaking:
-                        is_speaking = True
-                        console.log("[dim]Voice start detected...[/dim]")
-                    
-                    speech_buffer.append(audio_chunk)
-                    silence_start_time = None
-                    
-                else:
-                    if is_speaking:
-                        speech_buffer.append(audio_chunk)
-                        
-                        if silence_start_time is None:
-                            silence_start_time = current_time
+                audio = np.frombuffer(data, dtype=np.int16)
+                n_frames = len(audio) // self.CHUNK
+                frames = audio[:n_frames * self.CHUNK].reshape(n_frames, self.CHUNK).astype(np.float32)
+                frames *= 1.0 / 32768.0
+                if self.aec is not None:
+                    self._cancel_echo(frames, captured_at)
+                # 说话过程中跳过闸门，句尾静音完全由 VAD 判断
+                speech_probs = self.vad.process(frames, force=speech.active)
+
+                for frame, speech_prob in zip(frames, speech_probs):
+                    if self.aec is not None:
+                        if speech_prob > config.STT_BARGE_IN_THRESHOLD and self.playback_active():
+                            voiced_run += 1
+                            if voiced_run >= barge_in_frames and not barged_in:
+                                barged_in = True
+                                self._fire_barge_in()
+                        else:
+                            voiced_run = 0
+                            if not speech.active:
+                                barged_in = False
+
+                    # [修改] 回复播放期间，只有确认插话后才开始录一句:
+                    # 线性回声消除后残留的自身回声过不了插话门限，不会变成一句 "新输入"
+                    echo_guard = (self.aec is not None and not speech.active
+                                  and not barged_in and self.playback_active())
+
+                    if speech_prob > self.vad_threshold and not echo_guard:
+                        if not speech.active:
+                            console.log("[dim]Voice start detected...[/dim]")
+                            speech.begin()
+                            endpointer.reset()
+                        silence_samples = 0
                         
-                        if current_time - silence_start_time > self.silence_duration_threshold:
-                            console.log("[dim]End of sentence detected. Processing...[/dim]")
-                            self._process_buffer(speech_buffer)
-                            
-                            speech_buffer = []
-                            is_speaking = False
-                            silence_start_time = None
+                    elif speech.active:
+                        silence_samples += self.CHUNK
+                    else:
+                        # [新增] 未说话时只写预滚动 (插话确认前的几帧也在这里，开口处不会被截掉)
+                        speech.push_preroll(frame)
+                        continue
+
+                    full = speech.append(frame)
+                    endpointer.observe(speech_prob, silent=silence_samples > 0)
+                    if silence_samples == 0:
+                        speech.mark_voiced()
+                        done = False
+                    else:
+                        # [修改] 自适应断句取代固定的 0.8 秒静音
+                        done, reason, required = endpointer.decide(
+                            silence_samples / self.RATE, speech.length / self.RATE, self._fresh_partial_text()
+                        )
+                    if done:
+                        console.log(f"[dim]End of sentence detected ({reason}, waited {silence_samples * 1000 // self.RATE} ms / required {required * 1000:.0f} ms). Processing...[/dim]")
+                        self._put_asr(speech.finish())
+                        silence_samples = 0
+                    elif full:
+                        # [新增] 长段独白到达上限，强制切段后继续录
+                        console.log(f"[yellow]Utterance reached {config.STT_MAX_UTTERANCE_S}s, force-segmenting.[/yellow]")
+                        self._put_asr(speech.finish())
+                        speech.begin(with_preroll=False)
             
             except Exception as e:
                 console.print(f"[red]Error in audio processing loop:[/red] {e}")
                 time.sleep(0.5)
                 continue
 
-        stream.stop_stream()
-        stream.close()
-
-    def _process_buffer(self, buffer):
+    def _process_buffer(self, segment):
         """
         Process audio with SenseVoice.
+        segment: SpeechSegment (预分配槽位上的视图)
         """
-        if not buffer:
+        if segment is None or segment.duration == 0:
             return
 
-        # Combine chunks
-        full_audio_int16 = np.concatenate(buffer)
-        
-        # Convert to float32 normalized
-        full_audio_float32 = full_audio_int16.astype(np.float32) / 32768.0
-        
         try:
-            # Inference
-            asr_res = self.asr_model.generate(
-                input=full_audio_float32,
-                cache={},
-                language="auto", 
-                use_itn=True,
-                batch_size_s=60
-            )
-            
-            # Extract SenseVoice Raw Text
-            raw_sensevoice = ""
-            if asr_res and isinstance(asr_res, list) and len(asr_res) > 0:
-                raw_sensevoice = asr_res[0].get("text", "")
+            partial = self._partial
+            if partial and partial[0] == segment.utterance_id and partial[1] >= segment.voiced_length:
+                # [新增] 最后一次增量识别已覆盖全部有声部分，直接复用
+                raw_sensevoice = partial[2]
+                self.partial_reused += 1
+            else:
+                # Inference (SenseVoice Raw Text)
+                with self._asr_lock:
+                    raw_sensevoice = self.asr.transcribe(segment.audio)
 
             # Parse Output
             self._parse_and_callback(raw_sensevoice)
@@ -233,9 +452,10 @@ class STTEngine:
         except Exception as e:
             console.print(f"[red]Transcription Error:[/red] {e}")
 
-    def _parse_and_callback(self, raw_sensevoice):
+    def _parse_and_callback(self, raw_sensevoice, partial=False):
         """
         Parse SenseVoice results and trigger callback.
+        partial=True 时为说话过程中的增量结果 (perception_data["partial"] 为 True)
         """
         # 1. Parse SenseVoice Tags
         sv_tags = re.findall(r'<\|([A-Za-z0-9]+)\|>', raw_sensevoice)
@@ -273,9 +493,15 @@ class STTEngine:
             "emotion": sv_emotion,
             "event": sv_event,
             "raw": raw_sensevoice,
-            "lang": detected_lang
+            "lang": detected_lang,
+            "partial": partial
         }
 
+        if partial:
+            if clean_text and self.callback:
+                self.callback(perception_data)
+            return
+
         # 3. Output & Callback
         has_text = bool(clean_text)
         has_event = sv_event is not None
@@ -0,0 +1,137 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import config
+
+class TTSCache:
+    """
+    TTS 音频磁盘缓存 (内容寻址 + LRU 淘汰)
+    键 = hash(清洗后文本, text_lang, prompt_text, prompt_lang, 参考音频内容)
+    值 = 解码后的 float32 PCM (.npy，读取时 mmap，不占常驻内存)
+    文件名格式: <key>.<采样率>.npy，文件 mtime 即最近访问时间。
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        # key -> (path, fs, size)，按最近访问时间排序 (末尾最新)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._ref_hash_memo = (None, None)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """启动时从磁盘重建索引"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            parts = name.split(".")
+            if len(parts) != 3 or parts[2] != "npy" or not parts[1].isdigit():
+                continue
+            path = os.path.join(self.cache_dir, name)
+            st = os.stat(path)
+            found.append((st.st_mtime, parts[0], path, int(parts[1]), st.st_size))
+
+        for _, key, path, fs, size in sorted(found):
+            self._entries[key] = (path, fs, size)
+            self._total_bytes += size
+
+        if found:
+            config.console.print(f"[dim]TTS Cache: {len(found)} entries, {self._total_bytes / 1e6:.1f} MB[/dim]")
+
+    def _ref_audio_hash(self, ref_audio_path):
+        """参考音频内容哈希 (文件未变化时复用上次结果)"""
+        try:
+            st = os.stat(ref_audio_path)
+        except OSError:
+            return ""
+        signature = (ref_audio_path, st.st_mtime, st.st_size)
+        memo_sig, memo_hash = self._ref_hash_memo
+        if memo_sig == signature:
+            return memo_hash
+
+        h = hashlib.sha256()
+        with open(ref_audio_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        self._ref_hash_memo = (signature, h.hexdigest())
+        return self._ref_hash_memo[1]
+
+    def make_key(self, params):
+        """根据 GPT-SoVITS 请求参数生成缓存键"""
+        h = hashlib.sha256()
+        for field in ("text", "text_lang", "prompt_text", "prompt_lang"):
+            h.update(str(params.get(field, "")).encode("utf-8"))
+            h.update(b"\0")
+        h.update(self._ref_audio_hash(params.get("ref_audio_path", "")).encode("ascii"))
+        return h.hexdigest()
+
+    def get(self, key):
+        """命中返回 (data, fs)，未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        path, fs, _ = entry
+        try:
+            os.utime(path)
+            return np.load(path, mmap_mode="r"), fs
+        except (OSError, ValueError):
+            # 文件被外部删除或损坏
+            self._remove(key)
+            return None
+
+    def put(self, key, data, fs):
+        path = os.path.join(self.cache_dir, f"{key}.{int(fs)}.npy")
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(data, dtype=np.float32))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            config.console.print(f"[yellow]TTS Cache write failed: {e}[/yellow]")
+            return
+
+        size = os.path.getsize(path)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._total_bytes -= old[2]
+            self._entries[key] = (path, int(fs), size)
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        """超出容量时淘汰最久未使用的条目 (调用方持有锁)"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (path, _, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try: os.remove(path)
+            except OSError: pass
+
+    def _remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._total_bytes -= entry[2]
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes
+        }
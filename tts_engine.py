@@ -1,15 +1,20 @@
-import requests
 import io
 import os
 import re
 import time
 import subprocess
 import threading
+import queue
+import random
 import numpy as np
-import sounddevice as sd
 import soundfile as sf
 import config
+import http_client
+from cancellation import CancelToken, CancelledError
 from rich.panel import Panel
+from sentence_splitter import split_sentences
+from audio_output import AudioOutputEngine
+from tts_cache import TTSCache
 
 class TTSEngine:
     """
@@ -19,12 +24,51 @@ class TTSEngine:
     def __init__(self, voice_config, lip_sync_callback=None, expression_callback=None):
         self.voice_cfg = voice_config
         self.enabled = False
+        # [新增] GPT-SoVITS 长连接客户端
+        self.http = http_client.get_client("tts")
         self.lip_sync_callback = lip_sync_callback
         self.expression_callback = expression_callback # [新增] 表情回调
-        self.audio_stream = None 
+        # [修改] 常驻输出引擎: 所有音频共用一个输出流，不再每句话开关一次设备
+        # [新增] 嘴型包络参数 (播放前整段预计算): 门限 0.002, 增益 4.0, 可选平滑
+        envelope_cfg = {
+            "gate": voice_config.get("lipsync_gate", 0.002),
+            "gain": voice_config.get("lipsync_gain", 4.0),
+            "attack_ms": voice_config.get("lipsync_attack_ms", 0),
+            "release_ms": voice_config.get("lipsync_release_ms", 0),
+        }
+        self.output = AudioOutputEngine(
+            sample_rate=voice_config.get("output_sample_rate", 32000),
+            envelope_cfg=envelope_cfg
+        )
+        # [新增] 流水线模式: 分句合成，第 N 句播放时后台合成第 N+1 句
+        self.pipeline_mode = voice_config.get("pipeline_mode", True)
+        # [新增] 流式合成: 使用 GPT-SoVITS 的 streaming_mode，边下载边播放
+        # media_type: "wav" (从头部读取采样率) 或 "raw" (使用 stream_sample_rate)
+        self.streaming_mode = voice_config.get("streaming_mode", False)
+        self.stream_media_type = voice_config.get("stream_media_type", "wav")
+        self.stream_sample_rate = voice_config.get("stream_sample_rate", 32000)
+        # [新增] 整句合成也走流式接口 (需服务端支持 streaming_mode): 取消时能断开连接、让服务端停止生成。
+        # 关闭时 (默认) 整句合成仍用普通请求，取消只是丢弃结果，服务端会合成完这一句
+        self.cancel_via_stream = voice_config.get("cancel_via_stream", False)
+
+        # [新增] 磁盘音频缓存: 重复的台词直接播放，不走网络
+        self.cache = None
+        if voice_config.get("cache_enabled", True):
+            max_mb = voice_config.get("cache_max_mb", 512)
+            try:
+                self.cache = TTSCache(config.TTS_CACHE_DIR, max_mb * 1024 * 1024)
+            except OSError as e:
+                config.console.print(f"[yellow]⚠ TTS Cache disabled: {e}[/yellow]")
+
+        # [新增] 填充语库: 大脑思考太久时先 "嗯…" 一声，掩盖等待
+        self.filler_phrases = voice_config.get("filler_phrases", ["嗯…", "让我想想"])
+        self.filler_bank = []  # [(text, data, fs)]
         
         self._ensure_service_running()
 
+        if self.enabled and self.filler_phrases:
+            threading.Thread(target=self._prepare_fillers, daemon=True).start()
+
     def _ensure_service_running(self):
         """探测 TTS 服务状态"""
         if self._check_connection():
@@ -64,7 +108,7 @@ class TTSEngine:
     def _check_connection(self):
         try:
             test_url = config.TTS_API_URL.replace("/tts", "/") 
-            requests.get(test_url, timeout=1.0)
+            self.http.get(test_url, endpoint="health", retries=0)
             return True
         except:
             return False
@@ -89,10 +133,11 @@ class TTSEngine:
         text = re.sub(r'\s+', ' ', text).strip()
         return text if text else "..."
 
-    def speak(self, text, emotion="neutral"):
+    def speak(self, text, emotion="neutral", cancel_token=None):
         """
         执行语音合成并播放
         [修改] 接收 emotion 参数
+        cancel_token: [新增] 所属这一轮的取消令牌
         """
         if not self.enabled or not text:
             # [新增] 即使不说话，也要负责重置表情，防止卡在 Thinking
@@ -107,96 +152,327 @@ class TTSEngine:
             if self.expression_callback:
                 self.expression_callback("neutral")
             return
-        
-        with config.console.status(f"[bold blue]Synthesizing: '{clean_text}'...[/bold blue]", spinner="bouncingBar"):
+
+        if self.pipeline_mode or self.streaming_mode:
+            # 首音延迟只取决于第一句的合成时间
+            self.speak_stream(split_sentences(clean_text), emotion, cancel_token=cancel_token)
+            return
+
+        token, unregister = self._begin(cancel_token)
+        try:
+            with config.console.status(f"[bold blue]Synthesizing: '{clean_text}'...[/bold blue]", spinner="bouncingBar"):
+                audio = self._synthesize(clean_text, token)
+            if audio is not None and not token.cancelled:
+                data, fs = audio
+                # --- [核心修复] ---
+                # 音频下载完毕，准备播放了，这时候再触发表情
+                # 这样表情和声音就是同步的
+                self._set_expression(emotion, token)
+                self._play_with_lipsync(data, fs, cancel_token=token)
+                return
+        finally:
+            unregister()
+
+        # [新增] API 错误 / 异常 / 被取消也要重置
+        if self.expression_callback:
+            self.expression_callback("neutral")
+
+    def _begin(self, cancel_token):
+        """
+        开始一次播报: 没有传入取消令牌时新建一个 (不会被取消)，
+        取消时立即清空输出缓冲区、闭嘴
+        Returns: (token, 注销函数)
+        """
+        token = cancel_token or CancelToken()
+        return token, token.on_cancel(self.stop_output)
+
+    def _set_expression(self, emotion, cancel_token):
+        """开口时的表情 (已取消的轮次由 FaceEngine 跳过)"""
+        if self.expression_callback and not cancel_token.cancelled:
+            self.expression_callback(emotion, cancel_token=cancel_token)
+
+    def speak_stream(self, sentences, emotion="neutral", on_audio_start=None, cancel_token=None):
+        """
+        [新增] 逐句合成并播放 (配合流式大脑)
+        sentences 可以是边生成边产出的迭代器，第一句到达即可开口。
+
+        Args:
+            sentences: 句子迭代器
+            emotion: 开口时触发的表情
+            on_audio_start: 第一段音频开始播放时的回调 (用于统计首音延迟)
+            cancel_token: [新增] 所属这一轮的取消令牌。取消后不再合成、不再排队，
+                          已排队的音频立即清空
+        """
+        token, unregister = self._begin(cancel_token)
+        try:
+            if self.pipeline_mode or self.streaming_mode:
+                self._speak_pipelined(sentences, emotion, on_audio_start, token)
+            else:
+                self._speak_sequential(sentences, emotion, on_audio_start, token)
+        finally:
+            unregister()
+
+        # 整段说完 (或一句都没说出来) 再恢复 Neutral
+        if self.expression_callback:
+            self.expression_callback("neutral")
+
+    def _speak_sequential(self, sentences, emotion, on_audio_start, token):
+        """逐句: 合成一句 -> 播放一句"""
+        started = False
+        for sentence in sentences:
+            if token.cancelled:
+                break
+            if not self.enabled:
+                continue
+            clean_text = self._clean_text(sentence)
+            if not clean_text or clean_text == "...":
+                continue
+
+            config.console.print(f"[dim blue]Synthesizing: '{clean_text}'[/dim blue]")
+            audio = self._synthesize(clean_text, token)
+            if audio is None or token.cancelled:
+                continue
+
+            if not started:
+                started = True
+                self._set_expression(emotion, token)
+                if on_audio_start:
+                    on_audio_start()
+
+            data, fs = audio
+            self._play_with_lipsync(data, fs, reset_expression=False, cancel_token=token)
+
+    def _speak_pipelined(self, sentences, emotion, on_audio_start, token):
+        """
+        流水线: 后台线程持续合成，当前线程把音频依次送入输出引擎
+        """
+        audio_queue = queue.Queue()
+        threading.Thread(target=self._synthesis_worker, args=(sentences, audio_queue, token), daemon=True).start()
+
+        # 等第一句合成完毕 (流式合成下是第一个音频块)
+        first = self._next_audio(audio_queue, token)
+        if first is None:
+            return
+
+        self._set_expression(emotion, token)
+        if on_audio_start:
+            on_audio_start()
+
+        # 合成线程产出多少就往输出引擎里排多少，段与段无缝衔接
+        handle = self.output.enqueue(*first, cancel_token=token)
+        while True:
+            item = self._next_audio(audio_queue, token)
+            if item is None:
+                break
+            handle = self.output.enqueue(*item, cancel_token=token)
+        self.output.wait(handle)
+
+        if self.lip_sync_callback:
+            self.lip_sync_callback(0.0)
+
+    def _next_audio(self, audio_queue, token):
+        """取下一段合成好的音频；被取消时立即返回 None (不等待合成线程)"""
+        while not token.cancelled:
             try:
-                params = {
-                    "text": clean_text,
-                    "text_lang": self.voice_cfg.get("target_lang", "zh"),    
-                    "ref_audio_path": config.REF_AUDIO_PATH,            
-                    "prompt_text": self.voice_cfg.get("prompt_text", ""),
-                    "prompt_lang": self.voice_cfg.get("prompt_lang", "zh"),  
-                }
-                
-                # 这里是耗时操作 (约1-2秒)
-                response = requests.get(config.TTS_API_URL, params=params, timeout=30)
-
-                if response.status_code == 200:
-                    audio_data = io.BytesIO(response.content)
-                    data, fs = sf.read(audio_data, dtype='float32')
-                    
-                    # --- [核心修复] ---
-                    # 音频下载完毕，准备播放了，这时候再触发表情
-                    # 这样表情和声音就是同步的
-                    if self.expression_callback:
-                        self.expression_callback(emotion)
-                    
-                    self._play_with_lipsync(data, fs)
-                else:
-                    config.console.print(f"[red]TTS API Error ({response.status_code})[/red]")
-                    # [新增] API 错误也要重置
-                    if self.expression_callback:
-                        self.expression_callback("neutral")
-
-            except Exception as e:
+                return audio_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+        return None
+
+    def _synthesis_worker(self, sentences, audio_queue, token):
+        """合成线程: 逐句合成后放入队列，结束时放入 None"""
+        try:
+            for sentence in sentences:
+                if token.cancelled:
+                    break
+                if not self.enabled:
+                    continue
+                clean_text = self._clean_text(sentence)
+                if not clean_text or clean_text == "...":
+                    continue
+
+                config.console.print(f"[dim blue]Synthesizing: '{clean_text}'[/dim blue]")
+                if self.streaming_mode:
+                    for chunk in self._synthesize_stream(clean_text, token):
+                        if token.cancelled:
+                            break
+                        audio_queue.put(chunk)
+                    continue
+
+                audio = self._synthesize(clean_text, token)
+                if audio is not None:
+                    audio_queue.put(audio)
+        finally:
+            audio_queue.put(None)
+
+    def _synthesize_stream(self, clean_text, token=None):
+        """
+        [新增] 流式合成: 逐块解码 GPT-SoVITS 返回的 16-bit PCM
+        取消时连接由令牌关闭，正在读取的 iter_content 随之结束。
+        Yields: (chunk, fs)
+        """
+        params = self._build_params(clean_text)
+        cache_key = self.cache.make_key(params) if self.cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        params["streaming_mode"] = True
+        params["media_type"] = self.stream_media_type
+
+        response = None
+        try:
+            response = self.http.get(
+                config.TTS_API_URL, endpoint="synthesize", params=params, stream=True, cancel_token=token
+            )
+            if response.status_code != 200:
+                config.console.print(f"[red]TTS API Error ({response.status_code})[/red]")
+                return
+
+            fs = self.stream_sample_rate
+            need_header = self.stream_media_type == "wav"
+            pending = b""
+            chunks = []
+            for raw in response.iter_content(chunk_size=4096):
+                pending += raw
+                if need_header:
+                    # 标准 44 字节 WAV 头，采样率在 24~28 字节
+                    if len(pending) < 44:
+                        continue
+                    fs = int.from_bytes(pending[24:28], "little")
+                    pending = pending[44:]
+                    need_header = False
+
+                usable = len(pending) - len(pending) % 2
+                if usable:
+                    chunk = np.frombuffer(pending[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+                    pending = pending[usable:]
+                    chunks.append(chunk)
+                    yield chunk, fs
+
+            if cache_key and chunks and not (token and token.cancelled):
+                self.cache.put(cache_key, np.concatenate(chunks), fs)
+        except CancelledError:
+            pass
+        except Exception as e:
+            if not (token and token.cancelled):
                 config.console.print(f"[red]Audio Error:[/red] {e}")
-                # [新增] 异常也要重置
-                if self.expression_callback:
-                    self.expression_callback("neutral")
+        finally:
+            # 被打断时 (生成器提前关闭) 也要释放连接
+            if response is not None:
+                response.close()
 
-    def _play_with_lipsync(self, data, fs):
-        if data.ndim > 1:
-            amplitude_data = np.mean(data, axis=1)
-        else:
-            amplitude_data = data
+    def _prepare_fillers(self):
+        """启动时预合成填充语 (命中磁盘缓存时直接加载)，常驻内存"""
+        bank = []
+        for phrase in self.filler_phrases:
+            clean_text = self._clean_text(phrase)
+            if not clean_text or clean_text == "...":
+                continue
+            audio = self._synthesize(clean_text)
+            if audio is not None:
+                data, fs = audio
+                bank.append((clean_text, np.array(data, dtype=np.float32), fs))
+        self.filler_bank = bank
+        config.console.print(f"[dim]Filler bank ready: {len(bank)} phrases[/dim]")
 
-        blocksize = 1024 
-        current_frame = 0
-        
-        def callback(outdata, frames, time_info, status):
-            nonlocal current_frame
-            if status: print(status)
-            
-            chunk_size = len(outdata)
-            end_frame = current_frame + chunk_size
-            
-            chunk = data[current_frame:end_frame]
-            amp_chunk = amplitude_data[current_frame:end_frame]
-            
-            if len(chunk) < chunk_size:
-                outdata[:len(chunk)] = chunk.reshape(-1, 1) if chunk.ndim == 1 else chunk
-                outdata[len(chunk):] = 0
-                raise sd.CallbackStop()
-            else:
-                outdata[:] = chunk.reshape(-1, 1) if chunk.ndim == 1 else chunk
-            
-            # 保持之前的参数：门限 0.002, 增益 4.0
-            if len(amp_chunk) > 0:
-                rms = np.sqrt(np.mean(amp_chunk**2))
-            else:
-                rms = 0.0
-            
-            if rms < 0.002:
-                lipsync_value = 0.0
-            else:
-                lipsync_value = min(1.0, rms * 4.0)
+    def play_filler(self, cancel_token=None):
+        """
+        [新增] 播放一句随机填充语 (不切换表情，保持 Thinking)
+        正在播放其他音频时直接跳过。
+        Returns: 是否播放了
+        """
+        if not self.enabled or not self.filler_bank:
+            return False
+        if cancel_token is not None and cancel_token.cancelled:
+            return False
+        text, data, fs = random.choice(self.filler_bank)
+        if self.output.busy():
+            return False
+        config.console.print(f"[dim]Filler: '{text}'[/dim]")
+        self._play_with_lipsync(data, fs, reset_expression=False, cancel_token=cancel_token)
+        return True
 
-            lipsync_value = float(lipsync_value)
+    def mouth_level(self):
+        """当前播放位置的预计算包络值 (由 VTS 注入循环轮询，驱动嘴型)"""
+        # 没有排队的音频时总是闭嘴 (输出流卡住时 level 可能停在某个值上)
+        return self.output.level if self.output.busy() else 0.0
 
-            if self.lip_sync_callback:
-                self.lip_sync_callback(lipsync_value)
-            
-            current_frame += chunk_size
+    def _build_params(self, clean_text):
+        return {
+            "text": clean_text,
+            "text_lang": self.voice_cfg.get("target_lang", "zh"),    
+            "ref_audio_path": config.REF_AUDIO_PATH,            
+            "prompt_text": self.voice_cfg.get("prompt_text", ""),
+            "prompt_lang": self.voice_cfg.get("prompt_lang", "zh"),  
+        }
 
+    def _synthesize(self, clean_text, token=None):
+        """
+        请求 GPT-SoVITS 合成一段文本，返回 (data, fs)，失败或被取消返回 None
+        token: 取消令牌。取消时不再等待响应，迟到的结果直接丢弃；
+               开启 cancel_via_stream 时改走流式接口收齐整句，取消即断开连接
+        """
+        if token is not None and self.cancel_via_stream:
+            return self._synthesize_collected(clean_text, token)
         try:
-            with sd.OutputStream(samplerate=fs, callback=callback, blocksize=blocksize):
-                sd.sleep(int(len(data) / fs * 1000) + 100)
+            params = self._build_params(clean_text)
+            cache_key = self.cache.make_key(params) if self.cache else None
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            
+            # 这里是耗时操作 (约1-2秒)
+            response = self.http.get(config.TTS_API_URL, endpoint="synthesize", params=params, cancel_token=token)
+
+            if response.status_code == 200:
+                audio_data = io.BytesIO(response.content)
+                data, fs = sf.read(audio_data, dtype='float32')
+                if cache_key:
+                    self.cache.put(cache_key, data, fs)
+                if token is not None and token.cancelled:
+                    # 响应与取消恰好同时到达: 结果已缓存，本轮不再使用
+                    return None
+                return data, fs
+
+            config.console.print(f"[red]TTS API Error ({response.status_code})[/red]")
+        except CancelledError:
+            # 这一轮已放弃: 不等服务器返回
+            pass
         except Exception as e:
-            config.console.print(f"[red]Playback Error:[/red] {e}")
+            config.console.print(f"[red]Audio Error:[/red] {e}")
+        return None
+
+    def _synthesize_collected(self, clean_text, token):
+        """可取消的整句合成: 把流式合成的各块拼成一段 (缓存命中时直接返回)"""
+        chunks = []
+        fs = None
+        for chunk, fs in self._synthesize_stream(clean_text, token):
+            chunks.append(chunk)
+        if token.cancelled or not chunks:
+            return None
+        return (chunks[0] if len(chunks) == 1 else np.concatenate(chunks)), fs
+
+    def _play_with_lipsync(self, data, fs, reset_expression=True, cancel_token=None):
+        """播放一段音频并等待播完 (嘴型由输出引擎的响度回调驱动)"""
+        handle = self.output.enqueue(data, fs, cancel_token=cancel_token)
+        self.output.wait(handle)
             
         if self.lip_sync_callback:
             self.lip_sync_callback(0.0)
             
         # [新增] 播放结束后，恢复 Neutral 表情 (Decay)
-        if self.expression_callback:
-            self.expression_callback("neutral")
\ No newline at end of file
+        if reset_expression and self.expression_callback:
+            self.expression_callback("neutral")
+
+    def stop_output(self):
+        """立即停止播放: 清空输出缓冲区并闭嘴 (注册为取消令牌的回调，停止一轮只走这一条路径)"""
+        self.output.flush()
+        if self.lip_sync_callback:
+            self.lip_sync_callback(0.0)
+
+    def close(self):
+        self.output.close()
@@ -0,0 +1,215 @@
+from collections import deque
+import numpy as np
+import config
+from startup import timed_import
+
+class TorchSileroVAD:
+    """
+    Silero VAD (TorchScript) 后端
+    递归状态保存在模型内部，逐帧调用。
+    """
+    name = "torch"
+
+    def __init__(self, model, sample_rate=16000, device="cpu"):
+        self.torch = timed_import("torch")
+        self.model = model
+        self.sample_rate = sample_rate
+        self.device = device
+
+    def process(self, frames):
+        """
+        Args:
+            frames: float32 数组 (n_frames, frame_size)，按时间顺序
+        Returns: 每帧的语音概率 (n_frames,)
+        """
+        probs = np.empty(len(frames), dtype=np.float32)
+        with self.torch.no_grad():
+            for i, frame in enumerate(frames):
+                probs[i] = self.model(self.torch.from_numpy(frame).to(self.device), self.sample_rate).item()
+        return probs
+
+    def reset(self):
+        self.model.reset_states()
+
+
+class OnnxSileroVAD:
+    """
+    Silero VAD (ONNX Runtime) 后端
+    - 递归状态 (state) 与上下文 (前一帧末尾 64 个采样点) 显式保存在这里，
+      每次推理原样传入 / 取回，不依赖框架内部状态
+    - 单线程、顺序执行的会话，避免线程池唤醒开销挤占采集线程
+    - 输入缓冲区预分配，逐帧推理时不再分配内存
+    """
+    name = "onnx"
+    STATE_SHAPE = (2, 1, 128)
+
+    def __init__(self, model_path, sample_rate=16000, frame_size=512, intra_threads=1, inter_threads=1):
+        ort = timed_import("onnxruntime")
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = intra_threads
+        opts.inter_op_num_threads = inter_threads
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.context_size = 64 if sample_rate == 16000 else 32
+        self._sr = np.array(sample_rate, dtype=np.int64)
+        # [上下文 | 当前帧]
+        self._input = np.zeros((1, self.context_size + frame_size), dtype=np.float32)
+        self.reset()
+
+    def process(self, frames):
+        """
+        Args:
+            frames: float32 数组 (n_frames, frame_size)，按时间顺序
+        Returns: 每帧的语音概率 (n_frames,)
+        """
+        probs = np.empty(len(frames), dtype=np.float32)
+        ctx = self.context_size
+        buf = self._input
+        for i, frame in enumerate(frames):
+            buf[0, ctx:] = frame
+            out, self._state = self.session.run(None, {"input": buf, "state": self._state, "sr": self._sr})
+            probs[i] = out[0, 0]
+            buf[0, :ctx] = buf[0, -ctx:]
+        return probs
+
+    def reset(self):
+        self._state = np.zeros(self.STATE_SHAPE, dtype=np.float32)
+        self._input[:] = 0.0
+
+
+def create_vad(store, backend="onnx", sample_rate=16000, frame_size=512, device="cpu", threads=1):
+    """
+    按配置创建 VAD 后端；ONNX Runtime 不可用时回退到 TorchScript
+    Args:
+        store: ModelStore
+        backend: "onnx" / "torch"
+    """
+    if backend == "onnx":
+        try:
+            store.ensure_silero_vad()
+            path = store.silero_vad_file("onnx")
+            if path is None:
+                raise FileNotFoundError("silero_vad.onnx not in model store")
+            return OnnxSileroVAD(path, sample_rate, frame_size, intra_threads=threads)
+        except Exception as e:
+            config.console.print(f"[yellow]ONNX VAD unavailable ({e}), falling back to TorchScript.[/yellow]")
+    return TorchSileroVAD(store.load_silero_vad(device), sample_rate, device)
+
+
+class EnergyGate:
+    """
+    能量 / 过零率闸门 (自适应噪声底)
+    逐帧 RMS 与过零率向量化计算；RMS 明显高于噪声底的帧，
+    或过零率高 (清辅音) 且略高于噪声底的帧才放行。
+    噪声底只从非语音帧学习: 下降快、上升慢。
+    """
+    def __init__(self, ratio=2.0, zcr_threshold=0.25, zcr_ratio=1.4, rise=0.02, fall=0.2, min_floor=1e-4):
+        """
+        Args:
+            ratio: 放行阈值 = 噪声底 * ratio (2.0 约 +6dB)
+            zcr_threshold / zcr_ratio: 高过零率帧的放行条件 (过零率 > zcr_threshold 且 RMS > 噪声底 * zcr_ratio)
+            rise / fall: 噪声底上升 / 下降的平滑系数
+        """
+        self.ratio = ratio
+        self.zcr_threshold = zcr_threshold
+        self.zcr_ratio = zcr_ratio
+        self.rise = rise
+        self.fall = fall
+        self.min_floor = min_floor
+        self.floor = None
+
+    def measure(self, frames):
+        """Returns: (rms, zcr)，形状均为 (n_frames,)"""
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(1, frames.shape[1] - 1)
+        return rms, zcr
+
+    def update(self, frames):
+        """
+        Returns: (passed, rms)，passed 为每帧是否放行的布尔数组
+        """
+        rms, zcr = self.measure(frames)
+        if self.floor is None:
+            self.floor = max(self.min_floor, float(rms.min()))
+        passed = (rms > self.floor * self.ratio) | ((zcr > self.zcr_threshold) & (rms > self.floor * self.zcr_ratio))
+        for r in rms[~passed]:
+            self.observe(r)
+        return passed, rms
+
+    def observe(self, rms):
+        """用一帧非语音的 RMS 更新噪声底"""
+        alpha = self.fall if rms < self.floor else self.rise
+        self.floor = max(self.min_floor, self.floor + alpha * (rms - self.floor))
+
+
+class GatedVAD:
+    """
+    闸门 -> 神经 VAD 级联
+    闸门关闭的帧直接判为静音 (概率 0)，不调用神经网络。
+    闸门重新打开时，先把最近被跳过的几帧 (预滚动) 送入 VAD 让递归状态跟上，
+    语音起始不会因为状态陈旧而被截掉。
+    """
+    def __init__(self, vad, gate=None, preroll_frames=6, noise_prob=0.2, enabled=True):
+        """
+        Args:
+            enabled: False 时所有帧都直接交给 VAD (关闭闸门)
+            preroll_frames: 闸门打开前补送给 VAD 的帧数
+            noise_prob: 放行但 VAD 概率低于此值的帧也用于更新噪声底 (让噪声底跟上环境噪声的上升)
+        """
+        self.vad = vad
+        self.gate = gate or EnergyGate()
+        self.noise_prob = noise_prob
+        self.enabled = enabled
+        self._preroll = deque(maxlen=preroll_frames)
+        self._gap = 0
+        self.frames_total = 0
+        self.frames_skipped = 0
+
+    @property
+    def name(self):
+        return f"gate+{self.vad.name}" if self.enabled else self.vad.name
+
+    def process(self, frames, force=False):
+        """
+        Args:
+            force: True 时跳过闸门 (说话过程中，静音判断完全交给 VAD)
+        Returns: 每帧的语音概率 (n_frames,)
+        """
+        probs = np.zeros(len(frames), dtype=np.float32)
+        if force or not self.enabled:
+            passed, rms = np.ones(len(frames), dtype=bool), None
+        else:
+            passed, rms = self.gate.update(frames)
+
+        for i, frame in enumerate(frames):
+            self.frames_total += 1
+            if not passed[i]:
+                self.frames_skipped += 1
+                self._gap += 1
+                self._preroll.append(frame.copy())
+                continue
+            if self._gap:
+                # 跳过的帧比预滚动多时，VAD 的状态已经陈旧，先清空再补送
+                if self._gap > len(self._preroll):
+                    self.vad.reset()
+                if self._preroll:
+                    self.vad.process(np.stack(self._preroll))
+                self._preroll.clear()
+                self._gap = 0
+            probs[i] = self.vad.process(frame[None, :])[0]
+            if rms is not None and probs[i] < self.noise_prob:
+                self.gate.observe(rms[i])
+        return probs
+
+    def reset(self):
+        self.vad.reset()
+        self._preroll.clear()
+        self._gap = 0
+
+    def skip_ratio(self):
+        return self.frames_skipped / self.frames_total if self.frames_total else 0.0
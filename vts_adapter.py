@@ -1,8 +1,77 @@
 import asyncio
 import threading
+import itertools
 import json
-import pyvts
 import config
+from startup import timed_import
+
+class VTSClient:
+    """
+    VTS WebSocket 请求层
+    每个请求带唯一 requestID，由单一读取任务按 requestID 把响应分发给对应的 Future，
+    多个请求可以同时在途，慢请求不会挡住其他请求。
+    """
+    def __init__(self, websocket, default_timeout=5.0, on_close=None):
+        self.websocket = websocket
+        self.default_timeout = default_timeout
+        self.on_close = on_close
+        self.closed = False
+        # requestID -> Future
+        self._pending = {}
+        self._counter = itertools.count()
+        self._reader_task = None
+
+    def start(self):
+        """启动读取任务 (需在 event loop 中调用)"""
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    def _tag(self, payload):
+        tagged = dict(payload)
+        tagged["requestID"] = f"{payload.get('requestID', 'Ethereal')}-{next(self._counter)}"
+        return tagged
+
+    async def request(self, payload, timeout=None):
+        """发送请求并等待对应的响应"""
+        if self.closed:
+            raise ConnectionError("VTS connection closed")
+        tagged = self._tag(payload)
+        request_id = tagged["requestID"]
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self.websocket.send(json.dumps(tagged))
+            return await asyncio.wait_for(future, timeout or self.default_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def send(self, payload):
+        """只发送不等待 (参数注入用)，响应由读取任务直接丢弃"""
+        if self.closed:
+            raise ConnectionError("VTS connection closed")
+        await self.websocket.send(json.dumps(self._tag(payload)))
+
+    async def _read_loop(self):
+        try:
+            async for message in self.websocket:
+                try:
+                    response = json.loads(message)
+                except ValueError:
+                    continue
+                future = self._pending.get(response.get("requestID"))
+                if future is not None and not future.done():
+                    future.set_result(response)
+                elif response.get("messageType") == "APIError":
+                    config.console.print(f"[dim]VTS APIError: {response.get('data', {}).get('message', '')}[/dim]")
+        except Exception as e:
+            config.console.print(f"[red]VTS connection lost: {e}[/red]")
+        finally:
+            self.closed = True
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("VTS connection closed"))
+            if self.on_close:
+                self.on_close()
+
 
 class VTSAdapter:
     """
@@ -15,12 +84,14 @@ class VTSAdapter:
             "authentication_token_path": "./vts_token.txt"
         }
 
+        # pyvts 在后台加载线程里构造适配器时才导入
+        pyvts = timed_import("pyvts")
         self.vts = pyvts.vts(plugin_info=self.plugin_info)
         self.connected = False
         self.event_loop = None
 
-        # WebSocket 请求锁，防止并发调用 recv() 导致冲突
-        self._request_lock = None
+        # [修改] 认证完成后由 VTSClient 接管 WebSocket (按 requestID 分发响应，不再全局加锁)
+        self.client = None
 
         # 存储表情列表: { "ExpressionName": "ExpressionFile" }
         self.expression_cache = {}
@@ -29,6 +100,22 @@ class VTSAdapter:
         # 表情切换的淡入淡出时间 (秒)
         self.expression_fade_time = 0.5
 
+        # [新增] 参数注入: 只保留每个参数的最新值，按固定频率批量发送
+        # { "ParameterId": value }，队列深度最多等于参数个数
+        self._pending_params = {}
+        self._param_lock = threading.Lock()
+        # 参数注入频率 (Hz)
+        self.param_tick_rate = 60
+        # 被新值覆盖、没来得及发送的旧值个数
+        self.param_updates_dropped = 0
+        # [新增] 嘴型数据源 mouth_source() -> float，注入循环每个 tick 轮询一次
+        # (音频回调里不做任何加锁 / 分配，只发布当前值)
+        self.mouth_source = None
+        self._last_mouth = None
+        self._last_mouth_sent = 0.0
+        # 值不变时的重发间隔 (秒): VTS 约 1 秒收不到注入值就交还给面部追踪
+        self.mouth_resend_interval = 0.5
+
         threading.Thread(target=self._run_loop, daemon=True).start()
 
     def _run_loop(self):
@@ -39,28 +126,34 @@ class VTSAdapter:
 
     async def _connect_and_auth(self):
         try:
-            # 在 event loop 中初始化请求锁
-            self._request_lock = asyncio.Lock()
-
             await self.vts.connect()
             await self.vts.request_authenticate_token()
             await self.vts.request_authenticate()
 
+            # 认证阶段是串行的一问一答，之后的所有请求走 VTSClient
+            self.client = VTSClient(self.vts.websocket, on_close=self._on_connection_lost)
+            self.client.start()
+
             self.connected = True
             config.console.print("[green]✔ VTube Studio Link Established![/green]")
 
+            # 启动参数注入循环
+            self.event_loop.create_task(self._param_injection_loop())
+
             # 连接成功后，立即请求表情列表
             await self._fetch_expressions()
 
         except Exception as e:
             config.console.print(f"[red]❌ VTS Connection Failed: {e}[/red]")
 
-    async def _safe_request(self, payload):
+    def _on_connection_lost(self):
+        self.connected = False
+
+    async def _safe_request(self, payload, timeout=None):
         """
-        线程安全的 VTS 请求，使用锁防止 WebSocket 并发调用冲突
+        VTS 请求 (可并发)，由 VTSClient 按 requestID 匹配响应
         """
-        async with self._request_lock:
-            return await self.vts.request(payload)
+        return await self.client.request(payload, timeout)
 
     async def _fetch_expressions(self):
         """获取当前模型的所有表情文件"""
@@ -111,13 +204,14 @@ class VTSAdapter:
 
         return None
 
-    def set_expression_by_name(self, name_query, fade_time=None):
+    def set_expression_by_name(self, name_query, fade_time=None, cancel_token=None):
         """
         根据名称切换表情 (互斥切换 - 先关闭当前表情，再开启新表情)
         
         Args:
             name_query: 表情名称 (支持模糊匹配)。如果是 "Neutral" 或 "neutral"，则关闭当前表情。
             fade_time: 淡入淡出时间 (秒)，None 则使用默认值
+            cancel_token: [新增] 所属这一轮的取消令牌 (恢复 Neutral 不受取消影响)
         """
         # 特殊处理 Neutral: 直接关闭当前表情
         if name_query.lower() == "neutral":
@@ -133,20 +227,23 @@ class VTSAdapter:
         expr_file = self.find_expression(name_query)
         if expr_file:
             config.console.print(f"[VTS] Found expression '{name_query}' -> File: {expr_file}")
-            self.set_expression(expr_file, fade_time)
+            self.set_expression(expr_file, fade_time, cancel_token)
         else:
             config.console.print(f"[VTS] Expression not found for query: {name_query}")
 
-    def set_expression(self, expression_file, fade_time=None):
+    def set_expression(self, expression_file, fade_time=None, cancel_token=None):
         """
         切换到指定表情文件 (互斥切换)
 
         Args:
             expression_file: 表情文件名 (如 "Happy.exp3.json")
             fade_time: 淡入淡出时间 (秒)，None 则使用默认值
+            cancel_token: [新增] 取消令牌。已取消则不再调度；取消时撤销尚未完成的切换
         """
         if not self.connected or self.event_loop is None:
             return
+        if cancel_token is not None and cancel_token.cancelled:
+            return
 
         if fade_time is None:
             fade_time = self.expression_fade_time
@@ -162,6 +259,10 @@ class VTSAdapter:
                 if self.current_expression:
                     await self._deactivate_expression(self.current_expression, fade_time)
 
+                # 关闭旧表情期间这一轮被取消: 不再激活
+                if cancel_token is not None and cancel_token.cancelled:
+                    return
+
                 # 2. 激活新表情
                 await self._activate_expression(expression_file, fade_time)
                 self.current_expression = expression_file
@@ -169,7 +270,11 @@ class VTSAdapter:
             except Exception as e:
                 config.console.print(f"[red]Failed to switch expression: {e}[/red]")
 
-        asyncio.run_coroutine_threadsafe(_switch(), self.event_loop)
+        future = asyncio.run_coroutine_threadsafe(_switch(), self.event_loop)
+        if cancel_token is not None:
+            # 还在等 VTS 应答的切换随这一轮一起撤销
+            unregister = cancel_token.on_cancel(future.cancel)
+            future.add_done_callback(lambda _: unregister())
 
     async def _activate_expression(self, expression_file, fade_time):
         """激活表情"""
@@ -227,24 +332,61 @@ class VTSAdapter:
         except Exception as e:
             config.console.print(f"[red]Failed to deactivate expressions: {e}[/red]")
 
+    def set_parameter(self, param_id, value):
+        """
+        [新增] 设置参数值 (任意线程调用，不阻塞)
+        只记录最新值，由注入循环在下一个 tick 发送，旧值直接丢弃。
+        """
+        with self._param_lock:
+            if param_id in self._pending_params:
+                self.param_updates_dropped += 1
+            self._pending_params[param_id] = value
+
     def set_mouth_open(self, value):
         if not self.connected or self.event_loop is None: return
-        
-        async def _send():
-            try:
-                payload = {
-                    "apiName": "VTubeStudioPublicAPI",
-                    "apiVersion": "1.0",
-                    "requestID": "LipSync",
-                    "messageType": "InjectParameterDataRequest",
-                    "data": {
-                        "faceFound": False,
-                        "mode": "set",
-                        "parameterValues": [{"id": "MouthOpen", "value": value, "weight": 1.0}]
-                    }
-                }
-                await self._safe_request(payload)
-            except Exception:
-                pass
-
-        asyncio.run_coroutine_threadsafe(_send(), self.event_loop)
\ No newline at end of file
+        self.set_parameter("MouthOpen", value)
+
+    async def _param_injection_loop(self):
+        """每个 tick 最多发送一个 InjectParameterDataRequest"""
+        interval = 1.0 / self.param_tick_rate
+        while self.connected and not self.client.closed:
+            tick_start = self.event_loop.time()
+
+            source = self.mouth_source
+            if source is not None:
+                try:
+                    value = float(source())
+                except Exception:
+                    value = None
+                # 值没变时只按重发间隔保活 (持续的元音 / 说完后闭着的嘴)
+                if value is not None and (value != self._last_mouth
+                                          or tick_start - self._last_mouth_sent >= self.mouth_resend_interval):
+                    self._last_mouth = value
+                    self._last_mouth_sent = tick_start
+                    self.set_parameter("MouthOpen", value)
+
+            with self._param_lock:
+                pending, self._pending_params = self._pending_params, {}
+
+            if pending:
+                try:
+                    # 参数注入不等响应，不占用请求通道
+                    await self.client.send({
+                        "apiName": "VTubeStudioPublicAPI",
+                        "apiVersion": "1.0",
+                        "requestID": "LipSync",
+                        "messageType": "InjectParameterDataRequest",
+                        "data": {
+                            "faceFound": False,
+                            "mode": "set",
+                            "parameterValues": [
+                                {"id": param_id, "value": value, "weight": 1.0}
+                                for param_id, value in pending.items()
+                            ]
+                        }
+                    })
+                except Exception:
+                    pass
+
+            elapsed = self.event_loop.time() - tick_start
+            await asyncio.sleep(max(0.0, interval - elapsed))